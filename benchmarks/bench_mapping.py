@@ -0,0 +1,58 @@
+"""Compare `ET.tostring(to_xml(...))` with the streaming `write_xml`.
+
+Usage: python -m benchmarks.bench_mapping [num_samplers]
+(requires jmx-tools to be installed)
+"""
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+from xml.etree import ElementTree as ET
+
+from jmx_tools import jmx_mapping as jm
+
+Samplers = jm.PyJMX("hashTree", [], leaf=False)
+
+
+def samplers(num_samplers):
+    for i in range(num_samplers):
+        yield jm.http_sampler("localhost", 8080, f"/items/{i}", method="get")
+
+
+def run_tostring(num_samplers, file):
+    root = Samplers(children=list(samplers(num_samplers)))
+    with open(file, "wb") as fp:
+        fp.write(ET.tostring(jm.to_xml(root), encoding="utf-8"))
+
+
+def run_stream(num_samplers, file):
+    root = Samplers(children=samplers(num_samplers))
+    with open(file, "w", encoding="utf-8") as fp:
+        jm.write_xml(root, fp)
+
+
+def main(num_samplers=100_000):
+    results = {}
+    with tempfile.TemporaryDirectory() as d:
+        for name, fn in [("tostring", run_tostring), ("stream", run_stream)]:
+            file = os.path.join(d, f"{name}.xml")
+            start = time.perf_counter()
+            fn(num_samplers, file)
+            elapsed = time.perf_counter() - start
+
+            # Second run for the memory, tracemalloc slows things down
+            tracemalloc.start()
+            fn(num_samplers, file)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(file, "rb") as fp:
+                results[name] = fp.read()
+            print(f"{name:9s} {elapsed:.3f}s, peak memory {peak / 2**10:.0f} KiB")
+
+    # ET.tostring with utf-8 encoding adds the xml declaration
+    assert results["tostring"].endswith(results["stream"])
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
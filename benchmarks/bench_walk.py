@@ -0,0 +1,95 @@
+"""Compare the naive callback walk with the indexed dispatch.
+
+Usage: python -m benchmarks.bench_walk [num_samplers]
+(requires jmx-tools to be installed)
+"""
+import sys
+import time
+from io import BytesIO
+from xml.etree import ElementTree as ET
+
+from jmx_tools import jmx_replace as jr
+
+
+def synthetic_plan(num_samplers):
+    root = ET.Element("jmeterTestPlan", version="1.2")
+    tree = ET.SubElement(root, "hashTree")
+    group = ET.SubElement(tree, "ThreadGroup", testclass="ThreadGroup")
+    for name, text in [("ThreadGroup.num_threads", "1"),
+                       ("ThreadGroup.duration", "60")]:
+        ET.SubElement(group, "stringProp", name=name).text = text
+    loop = ET.SubElement(group, "elementProp", name="ThreadGroup.main_controller")
+    ET.SubElement(loop, "stringProp", name="LoopController.loops").text = "1"
+    samplers = ET.SubElement(tree, "hashTree")
+
+    headers = ET.SubElement(samplers, "HeaderManager", testclass="HeaderManager")
+    headers = ET.SubElement(headers, "collectionProp", name="HeaderManager.headers")
+    header = ET.SubElement(headers, "elementProp", name="")
+    ET.SubElement(header, "stringProp", name="Header.name").text = "Authorization"
+    ET.SubElement(header, "stringProp", name="Header.value").text = "Bearer old"
+    ET.SubElement(samplers, "hashTree")
+
+    for i in range(num_samplers):
+        sampler = ET.SubElement(samplers, "HTTPSamplerProxy",
+                                testclass="HTTPSamplerProxy", testname=str(i))
+        for name, text in [("HTTPSampler.domain", "example.com"),
+                           ("HTTPSampler.protocol", "http"),
+                           ("HTTPSampler.path", f"/items/{i}"),
+                           ("HTTPSampler.method", "GET"),
+                           ("HTTPSampler.contentEncoding", ""),
+                           ("HTTPSampler.connect_timeout", "")]:
+            ET.SubElement(sampler, "stringProp", name=name).text = text
+        ET.SubElement(samplers, "hashTree")
+
+    data = BytesIO()
+    ET.ElementTree(root).write(data, encoding="utf-8")
+    return data.getvalue()
+
+
+def naive_walk(tree, callbacks):
+    for element in tree.iter():
+        for callback in callbacks:
+            element = callback(element)
+
+
+def indexed_walk(tree, callbacks):
+    index = jr.CallbackIndex(callbacks)
+    for element in tree.iter():
+        index(element)
+
+
+def main(num_samplers=7000):
+    plan = synthetic_plan(num_samplers)
+    num_elements = len(list(ET.fromstring(plan).iter()))
+    callbacks = [
+        jr.ReplaceBearer("new"),
+        jr.ReplaceCCU(100),
+        jr.ReplaceDuration("10m"),
+        jr.ReplaceLoopCount(-1),
+        jr.ReplaceDomain("localhost"),
+        jr.ReplaceProtocol("https"),
+        jr.NameToPath(prefix_method=True),
+    ]
+
+    #
+    # Only the callback pass is timed, parsing is the same for both
+    #
+    results = {}
+    for name, walk in [("naive", naive_walk), ("indexed", indexed_walk)]:
+        tree = ET.ElementTree(ET.fromstring(plan))
+        start = time.perf_counter()
+        walk(tree, callbacks)
+        results[name] = time.perf_counter() - start
+        output = BytesIO()
+        tree.write(output, encoding="utf-8")
+        results[name + "_output"] = output.getvalue()
+
+    assert results["naive_output"] == results["indexed_output"]
+    print(f"{num_elements} elements, {len(callbacks)} callbacks")
+    print(f"naive:   {results['naive']:.3f}s")
+    print(f"indexed: {results['indexed']:.3f}s")
+    print(f"speedup: {results['naive'] / results['indexed']:.2f}x")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -5,7 +5,10 @@ from copy import copy
 from .jmx_replace import walk_etree, ReplaceBearer, ReplaceCCU, ReplaceDuration
 from . import jmx_replace as jr
 from . import jmx_mapping as jm
+from . import jmx_template as jt
+from . import jmx_compile as jc
 from . import sync
+from .jvm import heap_size
 from braceexpand import braceexpand
 
 logging.getLogger().setLevel(logging.INFO)
@@ -39,11 +42,14 @@ def main_batch(parser, args, unknown):
     # Map to commands
     #
     num_splits = min(split_lengths)
+    batch_unknowns = [copy(unknown) for _ in range(num_splits)]
     for idx in split_index:
         splits = unknown[idx].split(delim)
         for b_idx, split_value in enumerate(splits):
             batch_unknowns[b_idx][idx] = split_value
     batch_args = [parser.parse_args(args_) for args_ in batch_unknowns]
+    for args_i in batch_args:
+        check_test_args(parser, args_i)
 
     #
     # Find the attribute that is different over the batch
@@ -62,6 +68,20 @@ def main_batch(parser, args, unknown):
         fmt = {k: getattr(args_i, k) for k in diff_attrs}
         args_i.output = args_i.output.format_map(fmt)
 
+    #
+    # Replace batches only parse each input file once
+    #
+    if all(args_i.action == "replace" for args_i in batch_args):
+        return jt.main(batch_args)
+
+    #
+    # Run batches with --engines share the same engines
+    #
+    if all(args_i.action == "run" and args_i.engines is not None
+           for args_i in batch_args):
+        from .jmx_run import main_batch as main_run_batch
+        return main_run_batch(batch_args)
+
     #
     # Finally, dispatch the action
     # Recursion, b*tch!
@@ -76,6 +96,21 @@ def dispatch_action(parser, args, unknown):
     elif args.action == "run":
         from .jmx_run import main as main_run
         main_run(args)
+    elif args.action == "capacity":
+        from .capacity import main as main_capacity
+        main_capacity(args)
+    elif args.action == "compile":
+        from .jmx_compile import main as main_compile
+        main_compile(args)
+    elif args.action == "merge":
+        from .jtl import main_merge
+        main_merge(args)
+    elif args.action == "store":
+        from .store import main as main_store
+        main_store(args)
+    elif args.action == "report":
+        from .report import main as main_report
+        main_report(args)
     elif args.action == "batch":
         main_batch(parser, args, unknown)
     elif args.action == "push":
@@ -87,6 +122,44 @@ def dispatch_action(parser, args, unknown):
             f"The action `{args.action}` is not implemented, sorry")
 
 
+def add_test_args(parser):
+    # Options of a single Jmeter run, shared by run and capacity
+    parser.add_argument("--heap", type=heap_size,
+                        help="Heap size (in GBs), or auto to size the heap "
+                        "from the test plan and the free memory")
+    parser.add_argument("--live", type=float, metavar="SECONDS",
+                        help="Print live statistics every SECONDS")
+    parser.add_argument("--abort-error-rate", type=float, metavar="PCT",
+                        help="With --live, stop the test when the error "
+                        "rate of an interval is above PCT percent")
+    parser.add_argument("--abort-p95", type=float, metavar="MS",
+                        help="With --live, stop the test when the p95 "
+                        "of an interval is above MS")
+    parser.add_argument("--abort-p99", type=float, metavar="MS",
+                        help="With --live, stop the test when the p99 "
+                        "of an interval is above MS")
+    parser.add_argument("--abort-min-samples", type=int, default=100,
+                        help="Minimum samples in an interval to check "
+                        "the abort thresholds")
+    parser.add_argument("--monitor", type=float, metavar="SECONDS",
+                        help="Sample CPU, memory and GC of Jmeter every "
+                        "SECONDS into <output>.resources.csv")
+    parser.add_argument("--histogram", action="store_true",
+                        help="Also write <output>.hist.json, to combine "
+                        "runs with the merge action")
+    parser.add_argument("--store", metavar="DIR",
+                        help="Ingest the .jtl file of each test "
+                        "into the results store DIR")
+
+
+def check_test_args(parser, args):
+    if args.action not in ("run", "capacity") or args.live is not None:
+        return
+    for option in ("abort_error_rate", "abort_p95", "abort_p99"):
+        if getattr(args, option) is not None:
+            parser.error(f"--{option.replace('_', '-')} requires --live")
+
+
 def main(args=None):
     parser = ArgumentParser()
 
@@ -98,6 +171,12 @@ def main(args=None):
     replace = actions.add_parser("replace")
     jr.add_args(replace)
 
+    #
+    # Compile postman collection to JMX
+    #
+    compile_ = actions.add_parser("compile")
+    jc.add_args(compile_)
+
     #
     # Batch action
     #
@@ -110,19 +189,126 @@ def main(args=None):
     run = actions.add_parser("run")
     run.add_argument("--input", "-i", required=True)
     run.add_argument("--output", "-o", required=True)
-    run.add_argument("--heap", type=int, help="Heap size (in GBs)")
     run.add_argument("--force", "-f", action="store_true",
                      help="Force overwrite the output files")
+    run.add_argument("--no-dashboard", action="store_true",
+                     help="Skip Jmeter's HTML report, "
+                     "compute the summary from the .jtl file")
+    add_test_args(run)
+    run.add_argument("--parallel", "-p", type=int, default=1,
+                     help="Number of tests running at the same time "
+                     "(directory mode)")
+    run.add_argument("--heap-budget", type=float,
+                     help="Total heap (in GBs) of the concurrent tests")
+    run.add_argument("--cpu-budget", type=int,
+                     help="Total CPUs of the concurrent tests "
+                     "(default: CPU count)")
+    run.add_argument("--cpus-per-test", type=int, default=1,
+                     help="CPUs reserved for each test")
+    run.add_argument("--resume", action="store_true",
+                     help="Skip the tests that already passed with the same "
+                     "JMX and options (directory mode)")
+    run.add_argument("--engines", type=int, metavar="N",
+                     help="Run the tests on N warm jmeter-server engines "
+                     "started once for all the tests")
+
+    #
+    # Capacity search
+    #
+    capacity = actions.add_parser("capacity")
+    capacity.add_argument("input", metavar="jmx")
+    capacity.add_argument("--output", "-o", required=True,
+                          help="output folder of the tested levels")
+    capacity.add_argument("--p95", type=float, metavar="MS",
+                          help="p95 target (ms)")
+    capacity.add_argument("--p99", type=float, metavar="MS",
+                          help="p99 target (ms)")
+    capacity.add_argument("--error-rate", type=float, metavar="PCT",
+                          help="error rate target (percent)")
+    capacity.add_argument("--duration", help="Thread's life time per level")
+    capacity.add_argument("--start", type=int, default=10,
+                          help="first CCU level")
+    capacity.add_argument("--max", type=int, default=10000,
+                          help="highest CCU level")
+    capacity.add_argument("--factor", type=float, default=2,
+                          help="CCU growth factor of the ramp")
+    capacity.add_argument("--resolution", type=int, default=10,
+                          help="stop the binary search when the gap "
+                          "is below this number of users")
+    capacity.add_argument("--force", "-f", action="store_true",
+                          help="Run the levels again instead of reusing "
+                          "their results")
+    add_test_args(capacity)
+
+    #
+    # Merge histograms of several runs
+    #
+    merge = actions.add_parser("merge")
+    merge.add_argument("inputs", nargs="+", metavar="hist",
+                       help=".hist.json files written by the run action")
+    merge.add_argument("--output", "-o", required=True,
+                       help="output CSV file")
+    merge.add_argument("--histogram",
+                       help="also write the merged .hist.json file")
+
+    #
+    # Reports
+    #
+    report = actions.add_parser("report")
+    reports = report.add_subparsers(dest="report", required=True)
+    scaling = reports.add_parser("scaling")
+    scaling.add_argument("inputs", nargs="+", metavar="csv",
+                         help="summaries of the same test at several CCUs")
+    scaling.add_argument("--output", "-o", required=True,
+                         help="output HTML file")
+    scaling.add_argument("--csv", help="also write the table as CSV")
+    scaling.add_argument("--ccu-pattern",
+                         help="regex with one group matching the CCU "
+                         "in the file paths (default: last number of the "
+                         "file name, or of the path)")
+    scaling.add_argument("--min-efficiency", type=float, default=0.5,
+                         help="relative throughput gain / relative CCU "
+                         "gain under which the throughput stops scaling")
+    scaling.add_argument("--max-latency-growth", type=float, default=0.2,
+                         help="p95 growth between two levels above which "
+                         "the latency climbs")
+
+    #
+    # Results store
+    #
+    store = actions.add_parser("store")
+    store.add_argument("store", metavar="DIR", help="results store")
+    store_actions = store.add_subparsers(dest="store_action", required=True)
+    store_ingest = store_actions.add_parser("ingest")
+    store_ingest.add_argument("inputs", nargs="+", metavar="jtl")
+    store_ingest.add_argument("--jmx",
+                              help="JMX file of the run, for the tags")
+    store_ingest.add_argument("--test", help="test name")
+    store_query = store_actions.add_parser("query")
+    store_query.add_argument("--label")
+    store_query.add_argument("--test")
+    store_query.add_argument("--ccu", type=int)
+    store_query.add_argument("--last", type=int,
+                             help="only the last N runs")
+    store_query.add_argument("--output", "-o", help="output CSV file")
 
     #
     # Sync action
     #
     sync_push = actions.add_parser("push")
     sync_push.add_argument("inputs", nargs='*')
+    sync_push.add_argument("--port", type=int, default=sync.port,
+                           help=f"Port to listen on (default: {sync.port})")
     sync_pull = actions.add_parser("pull")
     sync_pull.add_argument("host")
+    sync_pull.add_argument("--port", type=int, default=sync.port,
+                           help=f"Port of the push side (default: {sync.port})")
+    sync_pull.add_argument("--jobs", "-j", type=int,
+                           help="Number of files downloaded in parallel "
+                           "(default: 4)")
 
     args, unknown = parser.parse_known_args(args)
+    check_test_args(parser, args)
     dispatch_action(parser, args, unknown)
 
 
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import sys
+from copy import copy
+from dataclasses import dataclass, asdict
+from os import path, makedirs
+
+import pandas as pd
+
+from . import jmx_run
+from . import utils
+from .jmx_replace import walk_etree, ReplaceCCU, ReplaceDuration
+
+
+@dataclass
+class Level:
+    ccu: int
+    passed: bool
+    reason: str
+    samples: int = 0
+    throughput: float = float("nan")
+    p95: float = float("nan")
+    p99: float = float("nan")
+    error_pct: float = float("nan")
+    reused: bool = False
+
+
+class CapacitySearch:
+    """Find the highest CCU of a test plan that meets latency and error targets.
+
+    The CCU is doubled (`factor`) from `start` until a level fails, then
+    the gap between the highest passing and the lowest failing level is
+    bisected down to `resolution` users. Each level is run once, levels
+    run before with the same plan and options are reused, see
+    `jmx_run.RunJournal`.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.name = path.splitext(path.basename(args.input))[0]
+        self.levels = {}
+        self.journal = jmx_run.RunJournal(
+            path.join(args.output, jmx_run.JOURNAL_FILE))
+        self.input_hash = utils.file_hash(args.input)
+
+    def files(self, ccu):
+        base = path.join(self.args.output, f"{self.name}-{ccu}")
+        return f"{base}.jmx", f"{base}.csv"
+
+    def key(self, ccu):
+        args = self.args
+        options = dict(
+            jmx=self.input_hash,
+            ccu=ccu,
+            duration=args.duration,
+            heap=args.heap,
+            p95=args.p95,
+            p99=args.p99,
+            error_rate=args.error_rate,
+            version=utils.tool_version(),
+        )
+        key = json.dumps(options, sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def check(self, summary):
+        args = self.args
+        total = summary[summary["transaction"] == "Total"]
+        if len(total) == 0:
+            total = summary.iloc[-1:]
+        total = total.iloc[0]
+        level = dict(
+            samples=int(total["sampleCount"]),
+            throughput=float(total.get("throughput", float("nan"))),
+            p95=float(total["pct2ResTime"]),
+            p99=float(total["pct3ResTime"]),
+            error_pct=float(total["errorPct"]),
+        )
+        reasons = []
+        if args.p95 is not None and level["p95"] > args.p95:
+            reasons.append(f"p95 {level['p95']:.0f}ms > {args.p95}ms")
+        if args.p99 is not None and level["p99"] > args.p99:
+            reasons.append(f"p99 {level['p99']:.0f}ms > {args.p99}ms")
+        if args.error_rate is not None and level["error_pct"] > args.error_rate:
+            reasons.append(
+                f"error rate {level['error_pct']:.2f}% > {args.error_rate}%")
+        return dict(level, passed=len(reasons) == 0,
+                    reason=", ".join(reasons))
+
+    def test(self, ccu):
+        if ccu in self.levels:
+            return self.levels[ccu]
+
+        jmx_file, output_file = self.files(ccu)
+        key = self.key(ccu)
+        reused = not self.args.force and self.journal.is_done(output_file, key)
+        if not reused and path.exists(output_file) and not self.args.force:
+            logging.info(f"CCU {ccu}: {output_file} was run with another "
+                         "plan or options, running it again")
+        if not reused:
+            #
+            # Write the test plan of this level and run it
+            #
+            callbacks = [ReplaceCCU(ccu)]
+            if self.args.duration is not None:
+                callbacks.append(ReplaceDuration(self.args.duration))
+            tree = walk_etree(self.args.input, callbacks)
+            tree.write(jmx_file, encoding="utf-8")
+
+            run_args = copy(self.args)
+            run_args.force = True
+            run_args.no_dashboard = True
+            logging.info(f"Testing CCU {ccu}")
+            returncode = jmx_run.run_test(run_args, jmx_file, output_file)
+            self.journal.record(output_file, jmx_file, key, returncode)
+            if returncode != 0:
+                level = Level(ccu, passed=False,
+                              reason=f"Jmeter exited with {returncode}")
+                self.levels[ccu] = level
+                return level
+
+        level = Level(ccu, reused=reused, **self.check(pd.read_csv(output_file)))
+        verdict = "pass" if level.passed else f"fail ({level.reason})"
+        logging.info(f"CCU {ccu}: {verdict}")
+        self.levels[ccu] = level
+        return level
+
+    def search(self):
+        args = self.args
+        passed, failed = 0, None
+
+        #
+        # Exponential ramp
+        #
+        ccu = args.start
+        while ccu <= args.max:
+            if not self.test(ccu).passed:
+                failed = ccu
+                break
+            passed = ccu
+            if ccu == args.max:
+                break
+            # At least one more user, int() can round a small factor away
+            ccu = min(max(ccu + 1, int(ccu * args.factor)), args.max)
+
+        #
+        # Binary search between the last pass and the first failure
+        #
+        if failed is not None:
+            while failed - passed > args.resolution:
+                mid = (passed + failed) // 2
+                if self.test(mid).passed:
+                    passed = mid
+                else:
+                    failed = mid
+        return passed
+
+    def evidence(self):
+        rows = [asdict(level) for _, level in sorted(self.levels.items())]
+        return pd.DataFrame(rows)
+
+
+def main(args):
+    if args.p95 is None and args.p99 is None and args.error_rate is None:
+        raise RuntimeError("Set at least one target: --p95, --p99 "
+                           "or --error-rate")
+    if args.factor <= 1:
+        raise RuntimeError("--factor must be greater than 1")
+    if args.start > args.max:
+        raise RuntimeError("--start must not be greater than --max")
+    makedirs(args.output, exist_ok=True)
+    jmx_run.forward_signals()
+
+    search = CapacitySearch(args)
+    capacity = search.search()
+
+    evidence_file = path.join(args.output, f"{search.name}-capacity.csv")
+    search.evidence().to_csv(evidence_file, index=False)
+    logging.info(f"Output written to {evidence_file}")
+    if capacity == 0:
+        logging.error(f"No level passed, CCU {args.start} already fails")
+        sys.exit(1)
+    print(f"{search.name}: max CCU meeting the targets is {capacity}")
@@ -0,0 +1,157 @@
+import logging
+import socket
+import time
+from os import path, environ, killpg
+from queue import Queue
+from threading import Lock
+from signal import SIGTERM, SIGKILL
+from subprocess import Popen, STDOUT, TimeoutExpired
+
+from . import utils
+
+if "JMETER_SERVER_PATH" in environ:
+    JMETER_SERVER_PATH = environ["JMETER_SERVER_PATH"]
+elif "JMETER_PATH" in environ:
+    JMETER_SERVER_PATH = path.join(path.dirname(environ["JMETER_PATH"]),
+                                   "jmeter-server")
+else:
+    JMETER_SERVER_PATH = "jmeter-server"
+
+# Local engines, RMI over SSL needs a keystore on both sides
+REMOTE_PROPERTIES = ["-Jserver.rmi.ssl.disable=true"]
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_port(port, proc, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Engine:
+    """One local `jmeter-server` process.
+
+    The RMI registry listens on `port`, the server object on `rmi_port`,
+    both are picked among the free ports of the machine.
+    """
+
+    def __init__(self, env=None, server_path=JMETER_SERVER_PATH):
+        self.env = env
+        self.server_path = server_path
+        self.proc = None
+        self.port = None
+        self.rmi_port = None
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self.port}"
+
+    def start(self, timeout=60):
+        self.port = free_port()
+        self.rmi_port = free_port()
+        cmd = [
+            self.server_path,
+            f"-Dserver_port={self.port}",
+            f"-Jserver.rmi.localport={self.rmi_port}",
+            "-Djava.rmi.server.hostname=127.0.0.1",
+            *REMOTE_PROPERTIES,
+        ]
+        log_file = path.join(utils.cache_dir("engines"),
+                             f"engine-{self.port}.log")
+        with open(log_file, "w") as log:
+            self.proc = Popen(cmd, stdout=log, stderr=STDOUT, env=self.env,
+                              start_new_session=True)
+        if not wait_port(self.port, self.proc, timeout):
+            self.stop()
+            raise RuntimeError(
+                f"Engine on port {self.port} did not start, see {log_file}")
+        logging.info(f"Engine started on {self.address}")
+
+    def stop(self, timeout=10):
+        if self.proc is None or self.proc.poll() is not None:
+            return
+        try:
+            killpg(self.proc.pid, SIGTERM)
+            self.proc.wait(timeout)
+        except TimeoutExpired:
+            killpg(self.proc.pid, SIGKILL)
+            self.proc.wait()
+        except ProcessLookupError:
+            pass
+        logging.info(f"Engine on {self.address} stopped")
+
+
+class EnginePool:
+    """Warm engines shared by the tests of a suite.
+
+    Each test borrows an idle engine for its duration. An engine whose
+    test failed or was aborted may still be running it, so it is
+    restarted before being handed out again.
+
+        with EnginePool(2) as pool:
+            engine = pool.acquire()
+            returncode = run_test(args, jmx_file, output_file, engine=engine)
+            pool.release(engine, healthy=returncode == 0)
+    """
+
+    def __init__(self, count, env=None, server_path=JMETER_SERVER_PATH):
+        env = {**environ, **(env or {})}
+        self.engines = [Engine(env, server_path) for _ in range(count)]
+        self.idle = Queue()
+        self.lost = 0
+        self.lock = Lock()
+
+    def start(self):
+        try:
+            for engine in self.engines:
+                engine.start()
+                self.idle.put(engine)
+        except Exception:
+            self.shutdown()
+            raise
+
+    def shutdown(self):
+        for engine in self.engines:
+            engine.stop()
+
+    def acquire(self):
+        engine = self.idle.get()
+        if engine is None:
+            # Lost engine, wake up the next waiting test too
+            self.idle.put(None)
+            raise RuntimeError("No engine left, see the log above")
+        return engine
+
+    def release(self, engine, healthy=True):
+        if not healthy or engine.proc.poll() is not None:
+            logging.warning(f"Restarting engine {engine.address}")
+            engine.stop()
+            try:
+                engine.start()
+            except Exception:
+                logging.exception("Could not restart the engine")
+                with self.lock:
+                    self.lost += 1
+                    if self.lost == len(self.engines):
+                        self.idle.put(None)
+                return
+        self.idle.put(engine)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
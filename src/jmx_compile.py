@@ -0,0 +1,206 @@
+import json
+import logging
+import re
+from os import path, remove, replace
+
+from . import jmx_mapping as jm
+from . import utils
+from .jmx_replace import parsetime
+
+
+def postman_vars(text):
+    # {{var}} -> ${var}
+    if text is None:
+        return ""
+    return re.sub(r"\{\{\s*([^{}]+?)\s*\}\}", r"${\1}", str(text))
+
+
+def enabled(items):
+    return [item for item in items or [] if not item.get("disabled", False)]
+
+
+def postman_bearer(auth):
+    if auth is None or auth.get("type") != "bearer":
+        return None
+    for item in auth.get("bearer", []):
+        if item.get("key") == "token":
+            return postman_vars(item.get("value"))
+    return None
+
+
+def compile_request(item, request_auth=True):
+    """Map a Postman 2.1 request item to a sampler and its headers.
+
+    The bearer token of the request, if any, is sent in its headers
+    unless `request_auth` is false. Other auth types are not supported.
+    """
+    request = item["request"]
+    url = request["url"]
+    if isinstance(url, str):
+        raise RuntimeError(
+            "Are you using old version of postman? Convert to 2.1 format"
+        )
+
+    #
+    # Path with path variables and query string
+    #
+    variables = {v["key"]: v.get("value") for v in url.get("variable", [])}
+    segments = []
+    for segment in utils.postman_path(url):
+        if segment.startswith(":") and segment[1:] in variables:
+            segment = variables[segment[1:]] or "${%s}" % segment[1:]
+        segments.append(postman_vars(segment))
+    path_ = "/" + "/".join(segments)
+    query = enabled(url.get("query"))
+    if len(query) > 0:
+        query_str = "&".join(
+            f"{postman_vars(q['key'])}={postman_vars(q.get('value'))}"
+            for q in query)
+        path_ = f"{path_}?{query_str}"
+
+    #
+    # Body, raw bodies are sent as is, forms as arguments
+    #
+    params = []
+    body = None
+    body_config = request.get("body") or {}
+    mode = body_config.get("mode")
+    if mode == "raw":
+        body = postman_vars(body_config.get("raw", ""))
+    elif mode in ("urlencoded", "formdata"):
+        for param in enabled(body_config.get(mode)):
+            if param.get("type", "text") != "text":
+                logging.warning(
+                    f"{item.get('name')}: skipping {param.get('type')} field "
+                    f"{param.get('key')}")
+                continue
+            params.append((postman_vars(param["key"]),
+                           postman_vars(param.get("value"))))
+    elif mode is not None:
+        logging.warning(f"{item.get('name')}: unsupported body mode {mode}")
+
+    sampler = jm.http_sampler(
+        host=postman_vars(utils.postman_host(url)),
+        port=postman_vars(url.get("port", "")),
+        path=path_,
+        method=request.get("method", "GET"),
+        params=params,
+        protocol=postman_vars(url.get("protocol", "")),
+        body=body,
+        testname=item.get("name"),
+    )
+    headers = [(postman_vars(h["key"]), postman_vars(h.get("value")))
+               for h in enabled(request.get("header"))]
+
+    #
+    # Request auth, overrides the bearer header of the collection
+    #
+    auth = request.get("auth")
+    if auth is not None:
+        bearer = postman_bearer(auth)
+        if bearer is not None:
+            if request_auth:
+                headers.append(("Authorization", f"Bearer {bearer}"))
+        else:
+            logging.warning(
+                f"{item.get('name')}: unsupported auth type "
+                f"{auth.get('type')}, the request is sent with the "
+                "bearer of the collection if any")
+    return sampler, headers
+
+
+def compile_postman(postman_config, args):
+    """Build the test plan for a Postman collection.
+
+    Samplers are generated lazily while the plan is written.
+    """
+    name = postman_config.get("info", {}).get("name", "Test Plan")
+    variables = [(v["key"], postman_vars(v.get("value")))
+                 for v in enabled(postman_config.get("variable"))]
+
+    #
+    # Thread group
+    #
+    duration = None
+    if args.duration is not None:
+        duration = parsetime(args.duration)
+    loops = args.loops
+    if loops is None:
+        loops = 1 if duration is None else -1
+    thread_group = jm.thread_group(
+        num_threads=args.ccu or 1,
+        loops=loops,
+        duration=duration,
+    )
+
+    #
+    # Bearer header shared by all samplers
+    #
+    bearer = None
+    if args.bf is not None:
+        with open(args.bf) as fp:
+            bearer = fp.read()
+    elif args.bi is not None:
+        bearer = args.bi
+    else:
+        bearer = postman_bearer(postman_config.get("auth"))
+
+    def children():
+        if bearer is not None:
+            headers = [("Authorization", f"Bearer {bearer}")]
+            yield jm.header_manager(headers), []
+
+        # A token given on the command line is used by every request
+        request_auth = args.bf is None and args.bi is None
+        items = []
+        utils.postman_walk(postman_config["item"], items.append)
+        for item in items:
+            sampler, headers = compile_request(item, request_auth)
+            subelements = []
+            if len(headers) > 0:
+                subelements = [jm.header_manager(headers),
+                               jm.hashTree()]
+            yield sampler, subelements
+
+    return jm.test_plan_tree(
+        jm.test_plan(name, variables),
+        thread_group,
+        children(),
+    )
+
+
+def main(args):
+    with open(args.input, encoding="utf-8") as f:
+        postman_config = json.load(f)
+
+    output_file = args.output
+    if output_file is None:
+        output_file = path.splitext(args.input)[0] + ".jmx"
+
+    plan = compile_postman(postman_config, args)
+    #
+    # The plan is written while it is compiled,
+    # only replace the output once it is complete
+    #
+    utils.prepare_write(output_file)
+    tmp_file = f"{output_file}.tmp"
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as fp:
+            jm.write_plan(plan, fp)
+    except BaseException:
+        if path.exists(tmp_file):
+            remove(tmp_file)
+        raise
+    replace(tmp_file, output_file)
+    logging.info(f"Output written to {output_file}")
+
+
+def add_args(parser):
+    parser.add_argument("input", help="Postman 2.1 collection",
+                        metavar="postman")
+    parser.add_argument("--output", "-o", help="output JMX file")
+    parser.add_argument("--bi", help="Bearer token (string)")
+    parser.add_argument("--bf", help="Bearer token (from file)")
+    parser.add_argument("--ccu", help="Number of threads", type=int)
+    parser.add_argument("--duration", help="Thread's life time")
+    parser.add_argument("--loops", help="Loop count per threads", type=int)
@@ -0,0 +1,122 @@
+from xml.etree import cElementTree as ET
+from collections import defaultdict
+
+THREAD_GROUPS = ("ThreadGroup", "SetupThreadGroup", "PostThreadGroup")
+
+
+class JmxDocument:
+    """A parsed JMX file with indexes built in one pass.
+
+    Elements are indexed by `testclass`, by property `name`, HTTP samplers
+    by path and method, and every element knows its parent, so the
+    selectors below run in O(matches) instead of walking the tree.
+    Changing the text of properties is fine, call `reindex` after
+    adding or removing elements, or after changing a sampler's path or method.
+
+        doc = JmxDocument.load("test.jmx")
+        for prop in doc.props("ThreadGroup.num_threads"):
+            prop.text = "100"
+        doc.write("test.jmx")
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.reindex()
+
+    @classmethod
+    def load(cls, file):
+        return cls(ET.parse(file))
+
+    def reindex(self):
+        self.parents = {}
+        self.by_testclass = defaultdict(list)
+        self.by_name = defaultdict(list)
+        self.by_path = defaultdict(list)
+        self.by_method = defaultdict(list)
+        self.groups = []
+
+        root = self.tree.getroot()
+        stack = [root]
+        while len(stack) > 0:
+            element = stack.pop()
+            testclass = element.get("testclass")
+            if testclass is not None:
+                self.by_testclass[testclass].append(element)
+                if testclass in THREAD_GROUPS:
+                    self.groups.append(element)
+
+            name = element.get("name")
+            if name is not None:
+                self.by_name[name].append(element)
+                parent = self.parents.get(element)
+                is_sampler = parent is not None and \
+                    parent.get("testclass") == "HTTPSamplerProxy"
+                if is_sampler and name == "HTTPSampler.path":
+                    self.by_path[element.text or ""].append(parent)
+                elif is_sampler and name == "HTTPSampler.method":
+                    self.by_method[(element.text or "").upper()].append(parent)
+
+            for child in element:
+                self.parents[child] = element
+            # reversed, so that the elements are indexed in document order
+            stack.extend(reversed(element))
+
+    #
+    # Selectors
+    #
+    def elements(self, testclass):
+        return list(self.by_testclass.get(testclass, []))
+
+    def props(self, name):
+        return list(self.by_name.get(name, []))
+
+    def thread_groups(self):
+        """Thread groups of every kind, in document order."""
+        return list(self.groups)
+
+    def samplers(self, path=None, method=None):
+        if path is None and method is None:
+            return self.elements("HTTPSamplerProxy")
+        if method is None:
+            return list(self.by_path.get(path, []))
+        method = method.upper()
+        by_method = self.by_method.get(method, [])
+        if path is None:
+            return list(by_method)
+
+        #
+        # Filter the smaller index with the properties of its samplers
+        #
+        by_path = self.by_path.get(path, [])
+        if len(by_path) <= len(by_method):
+            return [s for s in by_path
+                    if self.prop_text(s, "HTTPSampler.method").upper()
+                    == method]
+        return [s for s in by_method
+                if self.prop_text(s, "HTTPSampler.path") == path]
+
+    #
+    # Navigation
+    #
+    def parent(self, element):
+        return self.parents.get(element)
+
+    def ancestors(self, element):
+        element = self.parents.get(element)
+        while element is not None:
+            yield element
+            element = self.parents.get(element)
+
+    def prop(self, element, name):
+        """The direct child property of `element` with the given name."""
+        for child in element:
+            if child.get("name") == name:
+                return child
+        return None
+
+    def prop_text(self, element, name):
+        prop = self.prop(element, name)
+        return (prop.text if prop is not None else None) or ""
+
+    def write(self, file):
+        self.tree.write(file, encoding="utf-8")
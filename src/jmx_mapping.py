@@ -1,23 +1,30 @@
 from xml.etree import cElementTree as ET
-from dataclasses import make_dataclass
+# Serializer helpers, not re-exported by cElementTree
+from xml.etree.ElementTree import _escape_attrib, _escape_cdata
+from dataclasses import make_dataclass, fields, field
+from functools import lru_cache
 
 
 def PyJMX(name, attrs, leaf=False):
-    fields = [(a, str) for a in attrs]
+    # Attributes left to None are not written
+    fields = [(a, str, field(default=None)) for a in attrs]
 
     if leaf:
-        fields.append(('text', str))
+        fields.append(('text', str, field(default=None)))
     else:
-        fields.append(('children', str))
+        fields.append(('children', str, field(default=())))
 
-    return make_dataclass(name, fields)
+    return make_dataclass(name, fields, slots=True)
 
 
 def to_xml(tag):
     e = ET.Element(None)
     e.tag = tag.__class__.__name__
-    for k, v in vars(tag).items():
-        k = k.rstrip("_")  # _ at the right is for clashed name
+    for f in fields(tag):
+        v = getattr(tag, f.name)
+        k = f.name.rstrip("_")  # _ at the right is for clashed name
+        if v is None:
+            continue
         if k == 'text':
             e.text = str(v)
         elif k == 'children':
@@ -28,6 +35,49 @@ def to_xml(tag):
     return e
 
 
+@lru_cache(maxsize=None)
+def _field_names(cls):
+    return [(f.name, f.name.rstrip("_")) for f in fields(cls)]
+
+
+def write_xml(tag, fp):
+    """Write `tag` to the text file `fp` without building an ElementTree.
+
+    `children` can be any iterable, including generators, so large
+    documents are written in constant memory. The output is the same
+    as `ET.tostring(to_xml(tag), encoding="unicode")`.
+    """
+    write = fp.write
+    write("<" + tag.__class__.__name__)
+    text = None
+    children = ()
+    for name, k in _field_names(tag.__class__):
+        v = getattr(tag, name)
+        if v is None:
+            continue
+        if name == 'text':
+            text = str(v)
+        elif name == 'children':
+            children = v
+        else:
+            write(f' {k}="{_escape_attrib(str(v))}"')
+
+    children = iter(children)
+    first = next(children, None)
+    if not text and first is None:
+        write(" />")
+        return
+
+    write(">")
+    if text:
+        write(_escape_cdata(text))
+    if first is not None:
+        write_xml(first, fp)
+        for child in children:
+            write_xml(child, fp)
+    write(f"</{tag.__class__.__name__}>")
+
+
 #
 # Let the mapping begin!
 #
@@ -44,34 +94,33 @@ assertionsResultsToSave = PyJMX("assertionsResultsToSave", [], leaf=True)
 boolProp = PyJMX("boolProp", ['name'], leaf=True)
 bytes_ = PyJMX("bytes", [], leaf=True)
 code = PyJMX("code", [], leaf=True)
-collectionProp = PyJMX("collectionProp", ['name'], leaf=True)
+collectionProp = PyJMX("collectionProp", ['name'], leaf=False)
 connectTime = PyJMX("connectTime", [], leaf=True)
 dataType = PyJMX("dataType", [], leaf=True)
 elementProp = PyJMX("elementProp", [
-                    'name', 'elementType', 'guiclass', 'testclass', 'testname', 'enabled'], leaf=True)
-elementProp = PyJMX("elementProp", ['name', 'elementType'], leaf=True)
+                    'name', 'elementType', 'guiclass', 'testclass', 'testname', 'enabled'], leaf=False)
 encoding = PyJMX("encoding", [], leaf=True)
 fieldNames = PyJMX("fieldNames", [], leaf=True)
-hashTree = PyJMX("hashTree", [], leaf=True)
+hashTree = PyJMX("hashTree", [], leaf=False)
 HeaderManager = PyJMX(
-    "HeaderManager", ['guiclass', 'testclass', 'testname', 'enabled'], leaf=True)
+    "HeaderManager", ['guiclass', 'testclass', 'testname', 'enabled'], leaf=False)
 HTTPSamplerProxy = PyJMX("HTTPSamplerProxy", [
                          'guiclass', 'testclass', 'testname', 'enabled'], leaf=False)
 idleTime = PyJMX("idleTime", [], leaf=True)
 jmeterTestPlan = PyJMX(
-    "jmeterTestPlan", ['version', 'properties', 'jmeter'], leaf=True)
+    "jmeterTestPlan", ['version', 'properties', 'jmeter'], leaf=False)
 label = PyJMX("label", [], leaf=True)
 latency = PyJMX("latency", [], leaf=True)
 message = PyJMX("message", [], leaf=True)
 name = PyJMX("name", [], leaf=True)
-objProp = PyJMX("objProp", [], leaf=True)
+objProp = PyJMX("objProp", [], leaf=False)
 requestHeaders = PyJMX("requestHeaders", [], leaf=True)
 responseData = PyJMX("responseData", [], leaf=True)
 responseDataOnError = PyJMX("responseDataOnError", [], leaf=True)
 responseHeaders = PyJMX("responseHeaders", [], leaf=True)
 ResultCollector = PyJMX(
     "ResultCollector",
-    ['guiclass', 'testclass', 'testname', 'enabled'], leaf=True)
+    ['guiclass', 'testclass', 'testname', 'enabled'], leaf=False)
 samplerData = PyJMX("samplerData", [], leaf=True)
 saveAssertionResultsFailureMessage = PyJMX(
     "saveAssertionResultsFailureMessage", [], leaf=True)
@@ -80,15 +129,15 @@ stringProp = PyJMX("stringProp", ['name'], leaf=True)
 subresults = PyJMX("subresults", [], leaf=True)
 success = PyJMX("success", [], leaf=True)
 TestPlan = PyJMX(
-    "TestPlan", ['guiclass', 'testclass', 'testname', 'enabled'], leaf=True)
+    "TestPlan", ['guiclass', 'testclass', 'testname', 'enabled'], leaf=False)
 threadCounts = PyJMX("threadCounts", [], leaf=True)
 ThreadGroup = PyJMX(
-    "ThreadGroup", ['guiclass', 'testclass', 'testname', 'enabled'], leaf=True)
+    "ThreadGroup", ['guiclass', 'testclass', 'testname', 'enabled'], leaf=False)
 threadName = PyJMX("threadName", [], leaf=True)
 time = PyJMX("time", [], leaf=True)
 timestamp = PyJMX("timestamp", [], leaf=True)
 url = PyJMX("url", [], leaf=True)
-value = PyJMX("value", ['class_'], leaf=True)
+value = PyJMX("value", ['class_'], leaf=False)
 xml = PyJMX("xml", [], leaf=True)
 
 #
@@ -96,34 +145,184 @@ xml = PyJMX("xml", [], leaf=True)
 #
 
 
-def http_params(params):
-    pass
+def http_params(params, body=None):
+    if body is not None:
+        arguments = [
+            elementProp(name="", elementType="HTTPArgument", children=[
+                boolProp(name="HTTPArgument.always_encode", text="false"),
+                stringProp(name="Argument.value", text=body),
+                stringProp(name="Argument.metadata", text="="),
+            ])
+        ]
+    else:
+        arguments = [
+            elementProp(name=key, elementType="HTTPArgument", children=[
+                boolProp(name="HTTPArgument.always_encode", text="true"),
+                stringProp(name="Argument.value", text=value_),
+                stringProp(name="Argument.metadata", text="="),
+                boolProp(name="HTTPArgument.use_equals", text="true"),
+                stringProp(name="Argument.name", text=key),
+            ])
+            for key, value_ in params
+        ]
+    return elementProp(
+        name="HTTPsampler.Arguments",
+        elementType="Arguments",
+        guiclass="HTTPArgumentsPanel",
+        testclass="Arguments",
+        testname="User Defined Variables",
+        enabled="true",
+        children=[collectionProp(name="Arguments.arguments",
+                                 children=arguments)],
+    )
 
 
-def http_sampler(host, port, path, method, params=[]):
+def http_sampler(host, port, path, method, params=[], protocol="",
+                 body=None, testname=None):
+    children = []
+    if body is not None:
+        children.append(
+            boolProp(name="HTTPSampler.postBodyRaw", text="true"))
+    children.extend([
+        http_params(params, body),
+        stringProp(name="HTTPSampler.domain", text=host),
+        stringProp(name="HTTPSampler.port", text=port),
+        stringProp(name="HTTPSampler.protocol", text=protocol),
+        stringProp(name="HTTPSampler.contentEncoding", text=""),
+        stringProp(name="HTTPSampler.path", text=path),
+        stringProp(name="HTTPSampler.method", text=method.upper()),
+        boolProp(name="HTTPSampler.follow_redirects", text="true"),
+        boolProp(name="HTTPSampler.auto_redirects", text="false"),
+        boolProp(name="HTTPSampler.use_keepalive", text="true"),
+        boolProp(name="HTTPSampler.DO_MULTIPART_POST", text="false"),
+        stringProp(name="HTTPSampler.embedded_url_re", text=""),
+        stringProp(name="HTTPSampler.connect_timeout", text=""),
+        stringProp(name="HTTPSampler.response_timeout", text=""),
+    ])
     return HTTPSamplerProxy(
         guiclass='HttpTestSampleGui',
         testclass='HTTPSamplerProxy',
-        testname=host,
-        enabled=True,
+        testname=host if testname is None else testname,
+        enabled="true",
+        children=children,
+    )
+
+
+def header_manager(headers, testname="HTTP Header Manager"):
+    return HeaderManager(
+        guiclass="HeaderPanel",
+        testclass="HeaderManager",
+        testname=testname,
+        enabled="true",
+        children=[collectionProp(name="HeaderManager.headers", children=[
+            elementProp(name="", elementType="Header", children=[
+                stringProp(name="Header.name", text=key),
+                stringProp(name="Header.value", text=value_),
+            ])
+            for key, value_ in headers
+        ])],
+    )
+
+
+def test_plan(testname, variables=[]):
+    return TestPlan(
+        guiclass="TestPlanGui",
+        testclass="TestPlan",
+        testname=testname,
+        enabled="true",
         children=[
-            stringProp(name="HTTPSampler.domain", text=host),
-            stringProp(name="HTTPSampler.port", text=port),
-            stringProp(name="HTTPSampler.protocol", text=""),
-            stringProp(name="HTTPSampler.contentEncoding", text=""),
-            stringProp(name="HTTPSampler.path", text=path),
-            stringProp(name="HTTPSampler.method", text=method.upper()),
-            boolProp(name="HTTPSampler.follow_redirects", text="true"),
-            boolProp(name="HTTPSampler.auto_redirects", text="false"),
-            boolProp(name="HTTPSampler.use_keepalive", text="true"),
-            boolProp(name="HTTPSampler.DO_MULTIPART_POST", text="false"),
-            stringProp(name="HTTPSampler.embedded_url_re", text=""),
-            stringProp(name="HTTPSampler.connect_timeout", text=""),
-            stringProp(name="HTTPSampler.response_timeout", text=""),
-        ]
+            stringProp(name="TestPlan.comments", text=""),
+            boolProp(name="TestPlan.functional_mode", text="false"),
+            boolProp(name="TestPlan.tearDown_on_shutdown", text="true"),
+            boolProp(name="TestPlan.serialize_threadgroups", text="false"),
+            elementProp(
+                name="TestPlan.user_defined_variables",
+                elementType="Arguments",
+                guiclass="ArgumentsPanel",
+                testclass="Arguments",
+                testname="User Defined Variables",
+                enabled="true",
+                children=[collectionProp(name="Arguments.arguments", children=[
+                    elementProp(name=key, elementType="Argument", children=[
+                        stringProp(name="Argument.name", text=key),
+                        stringProp(name="Argument.value", text=value_),
+                        stringProp(name="Argument.metadata", text="="),
+                    ])
+                    for key, value_ in variables
+                ])],
+            ),
+            stringProp(name="TestPlan.user_define_classpath", text=""),
+        ],
+    )
+
+
+def thread_group(num_threads=1, loops=1, duration=None, ramp_time=1,
+                 testname="Thread Group"):
+    return ThreadGroup(
+        guiclass="ThreadGroupGui",
+        testclass="ThreadGroup",
+        testname=testname,
+        enabled="true",
+        children=[
+            stringProp(name="ThreadGroup.on_sample_error", text="continue"),
+            elementProp(
+                name="ThreadGroup.main_controller",
+                elementType="LoopController",
+                guiclass="LoopControlPanel",
+                testclass="LoopController",
+                testname="Loop Controller",
+                enabled="true",
+                children=[
+                    boolProp(name="LoopController.continue_forever",
+                             text="false"),
+                    stringProp(name="LoopController.loops", text=loops),
+                ],
+            ),
+            stringProp(name="ThreadGroup.num_threads", text=num_threads),
+            stringProp(name="ThreadGroup.ramp_time", text=ramp_time),
+            boolProp(name="ThreadGroup.scheduler",
+                     text="false" if duration is None else "true"),
+            stringProp(name="ThreadGroup.duration",
+                       text="" if duration is None else duration),
+            stringProp(name="ThreadGroup.delay", text=""),
+            boolProp(name="ThreadGroup.same_user_on_next_iteration",
+                     text="true"),
+        ],
     )
 
 
+def test_plan_tree(plan, thread_group_, children):
+    """Wrap the elements into the jmeterTestPlan/hashTree structure.
+
+    `children` is an iterable of (element, element's children) pairs,
+    placed under the thread group. Each element is followed by
+    its own hashTree, as JMeter expects.
+    """
+    def with_hash_trees(pairs):
+        for element, subelements in pairs:
+            yield element
+            yield hashTree(children=subelements)
+
+    return jmeterTestPlan(
+        version="1.2",
+        properties="5.0",
+        jmeter="5.6",
+        children=[hashTree(children=[
+            plan,
+            hashTree(children=[
+                thread_group_,
+                hashTree(children=with_hash_trees(children)),
+            ]),
+        ])],
+    )
+
+
+def write_plan(plan, fp):
+    fp.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    write_xml(plan, fp)
+    fp.write("\n")
+
+
 if __name__ == "__main__":
     sampler = http_sampler('localhost', 8080, '/items', method='get')
     xml = ET.tostring(to_xml(sampler))
@@ -1,14 +1,19 @@
 from xml.etree import cElementTree as ET
-from typing import Callable, List
-from dataclasses import dataclass
+# Serializer helpers, not re-exported by cElementTree
+from xml.etree.ElementTree import _escape_attrib, _escape_cdata
+from typing import Callable, List, Optional
+from dataclasses import dataclass, asdict
 from abc import abstractmethod, ABCMeta, ABC
 from functools import cached_property
 import json
+import hashlib
+import pickle
 import re
 import logging
+import tempfile
 
 from . import utils
-from os import path
+from os import path, replace, remove, curdir, stat
 
 
 def parsetime(timestr):
@@ -31,6 +36,16 @@ def parsetime(timestr):
 
 
 class Callback(ABC):
+    #
+    # Optional selectors, used by `CallbackIndex` to only consider
+    # this callback for elements with the matching tag, `name` or
+    # `testclass` attribute. `condition` is still checked afterwards,
+    # callbacks without any selector are tested on every element.
+    #
+    tag = None
+    name = None
+    testclass = None
+
     @abstractmethod
     def condition(self, element):
         ...
@@ -45,19 +60,173 @@ class Callback(ABC):
         else:
             return element
 
+    def config(self):
+        # Everything that affects the output, used as manifest key
+        return asdict(self)
+
+
+class CallbackIndex:
+    """Dispatch table mapping element selectors to callbacks.
+
+    Each callback is indexed by its most selective selector
+    (`name`, then `testclass`, then `tag`), so an element only
+    tests the callbacks that could possibly match it.
+    Callbacks are still applied in their original order.
+    """
+
+    def __init__(self, callbacks: List[Callback]):
+        self.by_name = {}
+        self.by_testclass = {}
+        self.by_tag = {}
+        self.fallback = []
+        for order, callback in enumerate(callbacks):
+            entry = (order, callback)
+            if callback.name is not None:
+                self.by_name.setdefault(callback.name, []).append(entry)
+            elif callback.testclass is not None:
+                self.by_testclass.setdefault(
+                    callback.testclass, []).append(entry)
+            elif callback.tag is not None:
+                self.by_tag.setdefault(callback.tag, []).append(entry)
+            else:
+                self.fallback.append(entry)
+
+    def lookup(self, element):
+        attrib = element.attrib
+        matches = None
+        for entries in (
+            self.by_name.get(attrib.get("name")),
+            self.by_testclass.get(attrib.get("testclass")),
+            self.by_tag.get(element.tag),
+            self.fallback,
+        ):
+            if not entries:
+                continue
+            if matches is None:
+                matches = entries
+            else:
+                matches = sorted(matches + entries)
+        return matches or ()
+
+    def __call__(self, element):
+        for _, callback in self.lookup(element):
+            element = callback(element)
+        return element
+
 
 def walk_etree(file, callbacks: List[Callback]):
     assert isinstance(callbacks, (list, tuple))
     tree = ET.parse(file)
+    index = CallbackIndex(callbacks)
     for element in tree.iter():
-        for callback in callbacks:
-            element = callback(element)
+        index(element)
     return tree
 
 
+def _start_tag(element):
+    attrs = "".join(
+        f' {k}="{_escape_attrib(v)}"' for k, v in element.items()
+    )
+    return f"<{element.tag}{attrs}"
+
+
+def stream_etree(input_file, output_file, callbacks: List[Callback]):
+    """Streaming version of `walk_etree` + `ElementTree.write`.
+
+    The root and `hashTree` elements are written as they are opened and
+    closed, every other element below them (test plan, thread groups,
+    samplers...) is collected until it completes, passed through the
+    callbacks, written and then dropped. The output is the same as
+    `walk_etree(input_file, callbacks).write(output_file, encoding="utf-8")`.
+    """
+    assert isinstance(callbacks, (list, tuple))
+    index = CallbackIndex(callbacks)
+
+    #
+    # Write to a temporary file first, input and output can be the same
+    #
+    utils.prepare_write(output_file)
+    tmp_file = f"{output_file}.tmp"
+    try:
+        with open(tmp_file, "w", encoding="utf-8",
+                  errors="xmlcharrefreplace", newline="\n") as fp:
+
+            # stack of (element, is_container)
+            stack = []
+            opened = set()
+
+            # the last finished element, its tail is written
+            # when the next sibling starts or when the parent ends
+            pending = None
+
+            def flush_pending():
+                nonlocal pending
+                if pending is not None and pending.tail:
+                    fp.write(_escape_cdata(pending.tail))
+                pending = None
+
+            def open_container(element):
+                index(element)
+                fp.write(_start_tag(element) + ">")
+                if element.text:
+                    fp.write(_escape_cdata(element.text))
+                opened.add(element)
+
+            for event, element in ET.iterparse(input_file, events=("start", "end")):
+                if event == "start":
+                    in_chunk = len(stack) > 0 and not stack[-1][1]
+                    if not in_chunk:
+                        if len(stack) > 0 and stack[-1][0] not in opened:
+                            open_container(stack[-1][0])
+                        flush_pending()
+                    is_container = not in_chunk and (
+                        len(stack) == 0 or element.tag == "hashTree")
+                    stack.append((element, is_container))
+                    continue
+
+                _, is_container = stack.pop()
+                parent = stack[-1][0] if len(stack) > 0 else None
+                in_chunk = parent is not None and not stack[-1][1]
+                if in_chunk:
+                    continue
+
+                if is_container:
+                    flush_pending()
+                    if element in opened:
+                        fp.write(f"</{element.tag}>")
+                        opened.remove(element)
+                    else:
+                        #
+                        # Container without children
+                        #
+                        tail, element.tail = element.tail, None
+                        index(element)
+                        fp.write(ET.tostring(element, encoding="unicode"))
+                        element.tail = tail
+                else:
+                    for subelement in element.iter():
+                        index(subelement)
+                    tail, element.tail = element.tail, None
+                    fp.write(ET.tostring(element, encoding="unicode"))
+                    element.tail = tail
+
+                pending = element
+                if parent is not None:
+                    parent.remove(element)
+    except BaseException:
+        # Never leave a partial output behind
+        if path.exists(tmp_file):
+            remove(tmp_file)
+        raise
+
+    replace(tmp_file, output_file)
+
+
 @dataclass
 class ReplaceBearer(Callback):
     bearer: str
+    tag = "collectionProp"
+    name = "HeaderManager.headers"
 
     def condition(self, e):
         ok = e.tag == "collectionProp"
@@ -74,6 +243,7 @@ class ReplaceBearer(Callback):
 @dataclass
 class ReplaceCCU(Callback):
     ccu: int
+    name = "ThreadGroup.num_threads"
 
     def condition(self, e):
         return e.attrib.get("name", "") == "ThreadGroup.num_threads"
@@ -86,6 +256,7 @@ class ReplaceCCU(Callback):
 @dataclass
 class ReplaceDuration(Callback):
     duration: str
+    name = "ThreadGroup.duration"
 
     def __post_init__(self):
         self.duration = parsetime(self.duration)
@@ -101,6 +272,7 @@ class ReplaceDuration(Callback):
 @dataclass
 class ReplaceLoopCount(Callback):
     loops: int
+    name = "LoopController.loops"
 
     def condition(self, el):
         return el.attrib.get("name", "") == "LoopController.loops"
@@ -113,6 +285,7 @@ class ReplaceLoopCount(Callback):
 @dataclass
 class NameToPath(Callback):
     prefix_method: bool
+    testclass = "HTTPSamplerProxy"
 
     def condition(self, el):
         return el.attrib.get("testclass", "") == "HTTPSamplerProxy"
@@ -133,14 +306,146 @@ class NameToPath(Callback):
         return http_sampler
 
 
+class _TrieNode:
+    __slots__ = ("children", "matches")
+
+    def __init__(self):
+        self.children = {}
+        # endpoint index -> fewest segments left after this node,
+        # in collection order
+        self.matches = {}
+
+    def add(self, idx, remaining):
+        if remaining < self.matches.get(idx, remaining + 1):
+            self.matches[idx] = remaining
+
+
 @dataclass
-class PostmanEndpointMatchCallback(Callback):
-    postman_file: str
+class EndpointMatch:
+    kind: str  # exact, prefix or substring
+    candidates: List[str]
+
+    @property
+    def endpoint(self):
+        return self.candidates[0]
+
+    @property
+    def ambiguous(self):
+        return len(self.candidates) > 1
+
+
+class PostmanMatcher:
+    """Match JMX sampler paths against Postman endpoints.
+
+    A sampler path matches an endpoint that contains it, candidates
+    are ranked exact > prefix > substring, then by the number of path
+    segments left after the match. Paths are compared without their
+    query, an exact match has the same path and query. Prefix and
+    segment-aligned substring matches are looked up in segment tries,
+    only the remaining cases fall back to a linear scan. Ties are
+    resolved by collection order and reported as ambiguous.
+    """
+
+    def __init__(self, endpoints):
+        self.endpoints = list(dict.fromkeys(endpoints))
+        self.queries = [self.query(endpoint) for endpoint in self.endpoints]
+        self.prefix_trie = _TrieNode()
+        self.inner_trie = _TrieNode()
+        self.ambiguous = {}
+        self._cache = {}
+
+        for idx, endpoint in enumerate(self.endpoints):
+            segments = self.segments(endpoint)
+            self.prefix_trie.add(idx, len(segments))
+            for start in range(len(segments)):
+                node = self.prefix_trie if start == 0 else self.inner_trie
+                for depth in range(start, len(segments)):
+                    node = node.children.setdefault(
+                        segments[depth], _TrieNode())
+                    node.add(idx, len(segments) - depth - 1)
+
+    @staticmethod
+    def segments(endpoint):
+        endpoint = endpoint.partition("?")[0]
+        return [segment for segment in endpoint.split("/") if segment]
+
+    @staticmethod
+    def query(endpoint):
+        return endpoint.partition("?")[2]
+
+    def lookup(self, trie, segments):
+        node = trie
+        for segment in segments:
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def _match(self, text):
+        #
+        # Segment aligned matches, starting from the root or not
+        #
+        segments = self.segments(text)
+        query = self.query(text)
+        for kind, trie in (("prefix", self.prefix_trie),
+                           ("substring", self.inner_trie)):
+            node = self.lookup(trie, segments)
+            if node is None or len(node.matches) == 0:
+                continue
+            ranks = {}
+            for idx, remaining in node.matches.items():
+                exact = kind == "prefix" and remaining == 0 \
+                    and self.queries[idx] == query
+                ranks[idx] = (not exact, remaining)
+            best = min(ranks.values())
+            candidates = [self.endpoints[idx]
+                          for idx, rank in ranks.items() if rank == best]
+            if not best[0]:
+                kind = "exact"
+            return EndpointMatch(kind, candidates)
+
+        #
+        # Raw substring, prefer the shortest endpoints
+        #
+        candidates = [endpoint for endpoint in self.endpoints
+                      if text in endpoint]
+        if len(candidates) == 0:
+            return None
+        shortest = min(map(len, candidates))
+        candidates = [c for c in candidates if len(c) == shortest]
+        return EndpointMatch("substring", candidates)
+
+    def match(self, text):
+        if text not in self._cache:
+            match = self._match(text)
+            if match is not None and match.ambiguous:
+                self.ambiguous[text] = match
+            self._cache[text] = match
+        return self._cache[text]
+
+
+def true_endpoint(url):
+    query = url.get("query", [])
+    query_str = "&".join(f"{q['key']}={q['value']}" for q in query)
+
+    endpoint = "/".join(utils.postman_path(url))
+    if len(query) > 0:
+        endpoint = f"{endpoint}?{query_str}"
+    endpoint = "/" + endpoint.lstrip("/")
+    return endpoint
 
-    @cached_property
-    def requests(self):
-        with open(self.postman_file, encoding="utf-8") as f:
-            postman_config = json.load(f)
+
+@dataclass
+class PostmanIndex:
+    hash: str
+    requests: list
+    matcher: PostmanMatcher
+
+    @classmethod
+    def build(cls, postman_file):
+        with open(postman_file, "rb") as f:
+            data = f.read()
+        postman_config = json.loads(data)
 
         items = utils.postman_all_items(postman_config)
         requests = []
@@ -151,36 +456,108 @@ class PostmanEndpointMatchCallback(Callback):
                 )
             request = item["request"]
             url = request["url"]
-            url["endpoint"] = self.true_endpoint(url)
+            url["endpoint"] = true_endpoint(url)
             requests.append(item["request"])
 
-        return requests
+        matcher = PostmanMatcher(
+            request["url"]["endpoint"] for request in requests)
+        return cls(hashlib.sha256(data).hexdigest(), requests, matcher)
+
+
+_postman_indexes = {}
+
+
+def load_postman_index(postman_file):
+    """Load the flattened requests and match index of a collection.
+
+    Indexes are shared in memory by every callback of the process and
+    pickled to the user cache directory, keyed by the collection path,
+    modification time and size.
+    """
+    postman_file = path.abspath(postman_file)
+    st = stat(postman_file)
+    key = (postman_file, st.st_mtime_ns, st.st_size, utils.tool_version())
+    if key in _postman_indexes:
+        return _postman_indexes[key]
+
+    name = hashlib.sha1(postman_file.encode("utf-8")).hexdigest()
+    index = None
+    try:
+        cache_file = path.join(utils.cache_dir("postman"), f"{name}.pickle")
+        with open(cache_file, "rb") as fp:
+            cached_key, cached_index = pickle.load(fp)
+        if cached_key == key:
+            index = cached_index
+    except Exception:
+        pass
+
+    if index is None:
+        index = PostmanIndex.build(postman_file)
+
+        #
+        # The cache is best effort, its directory may be read-only.
+        # Concurrent processes each write their own temporary file
+        #
+        tmp_file = None
+        try:
+            cache_dir = utils.cache_dir("postman")
+            with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp",
+                                             delete=False) as fp:
+                tmp_file = fp.name
+                pickle.dump((key, index), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            replace(tmp_file, path.join(cache_dir, f"{name}.pickle"))
+        except OSError as e:
+            logging.debug(f"Cannot cache the postman index: {e}")
+            if tmp_file is not None and path.exists(tmp_file):
+                remove(tmp_file)
+
+    _postman_indexes[key] = index
+    return index
 
-    def true_endpoint(self, url):
-        query = url.get("query", [])
-        query_str = "&".join(f"{q['key']}={q['value']}" for q in query)
 
-        endpoint = path.join(*url["path"])
-        if len(query) > 0:
-            endpoint = f"{endpoint}?{query_str}"
-        endpoint = "/" + endpoint.lstrip("/")
-        return endpoint
+@dataclass
+class PostmanEndpointMatchCallback(Callback):
+    postman_file: str
+    name = "HTTPSampler.path"
+
+    def config(self):
+        return dict(postman_file=self.postman_file,
+                    postman_hash=self.index.hash)
+
+    @cached_property
+    def index(self):
+        return load_postman_index(self.postman_file)
+
+    @property
+    def requests(self):
+        return self.index.requests
 
     def condition(self, el):
         return el.get("name") == "HTTPSampler.path"
 
+    @property
+    def matcher(self):
+        return self.index.matcher
+
     def callback(self, el):
-        for request in self.requests:
-            endpoint = request["url"]["endpoint"]
-            if el.text in endpoint:
-                logging.info(" ".join([el.text, "->", endpoint]))
-                el.text = endpoint
+        if el.text is None:
+            return el
+        match = self.matcher.match(el.text)
+        if match is None:
+            return el
+        if match.ambiguous:
+            logging.warning(
+                f"Ambiguous {match.kind} match for {el.text}: "
+                f"{', '.join(match.candidates)}, using {match.endpoint}")
+        logging.info(" ".join([el.text, "->", match.endpoint]))
+        el.text = match.endpoint
         return el
 
 
 @dataclass
 class ReplaceDomain(Callback):
     domain: str
+    name = "HTTPSampler.domain"
 
     def condition(self, el):
         return el.get("name") == "HTTPSampler.domain"
@@ -193,6 +570,7 @@ class ReplaceDomain(Callback):
 @dataclass
 class ReplaceProtocol(Callback):
     protocol: str
+    name = "HTTPSampler.protocol"
 
     def condition(self, el):
         return el.get("name") == "HTTPSampler.protocol"
@@ -202,8 +580,151 @@ class ReplaceProtocol(Callback):
         return el
 
 
-@utils.with_mux
-def main(args, input_file, output_file):
+def _set_prop(element, tag, name, text):
+    """Set the text of a direct child property, add it if missing.
+
+    Returns the previous text, None if the property was added.
+    """
+    for prop in element:
+        if prop.get("name") == name:
+            previous = prop.text
+            prop.text = text
+            return previous
+
+    #
+    # New property after the last one, with the same indentation
+    #
+    children = list(element)
+    prop = ET.SubElement(element, tag, name=name)
+    prop.text = text
+    if len(children) > 0:
+        last = children[-1]
+        prop.tail = last.tail
+        last.tail = children[-2].tail if len(children) > 1 else element.text
+    return None
+
+
+@dataclass
+class ConnectionPolicy(Callback):
+    """Apply the same connection settings to every HTTP sampler.
+
+    Options left to None are not changed.
+    """
+    keepalive: Optional[bool] = None
+    implementation: Optional[str] = None
+    connect_timeout: Optional[int] = None
+    response_timeout: Optional[int] = None
+    embedded_resources: Optional[bool] = None
+    testclass = "HTTPSamplerProxy"
+
+    def condition(self, el):
+        return el.attrib.get("testclass", "") == "HTTPSamplerProxy"
+
+    def props(self):
+        def bool_text(value):
+            return "true" if value else "false"
+
+        if self.keepalive is not None:
+            yield "boolProp", "HTTPSampler.use_keepalive", \
+                bool_text(self.keepalive)
+        if self.implementation is not None:
+            yield "stringProp", "HTTPSampler.implementation", \
+                self.implementation
+        if self.connect_timeout is not None:
+            yield "stringProp", "HTTPSampler.connect_timeout", \
+                str(self.connect_timeout)
+        if self.response_timeout is not None:
+            yield "stringProp", "HTTPSampler.response_timeout", \
+                str(self.response_timeout)
+        if self.embedded_resources is not None:
+            yield "boolProp", "HTTPSampler.image_parser", \
+                bool_text(self.embedded_resources)
+
+    def callback(self, http_sampler):
+        changes = []
+        for tag, name, text in self.props():
+            previous = _set_prop(http_sampler, tag, name, text)
+            if (previous or "") != text:
+                short_name = name.split(".", 1)[1]
+                changes.append(f"{short_name} {previous or '(unset)'} -> {text}")
+        if len(changes) > 0:
+            logging.info(f"{http_sampler.get('testname')}: "
+                         + ", ".join(changes))
+        return http_sampler
+
+
+# Listeners that only display samples in the GUI
+GUI_LISTENERS = {
+    "ViewResultsFullVisualizer",
+    "TableVisualizer",
+    "GraphVisualizer",
+    "StatVisualizer",
+    "SummaryReport",
+    "StatGraphVisualizer",
+    "RespTimeGraphVisualizer",
+    "AssertionVisualizer",
+    "ComparisonVisualizer",
+    "DistributionGraphVisualizer",
+    "SplineVisualizer",
+}
+
+# Save configuration fields kept by --lean, the columns of `jtl.JTL_COLUMNS`
+LEAN_FIELDS = {"time", "timestamp", "label", "success", "bytes",
+               "sentBytes", "fieldNames"}
+
+
+@dataclass
+class LeanResults(Callback):
+    """Disable GUI listeners and save only the columns of the aggregator.
+
+    GUI listeners without an output file only keep samples in memory in
+    non GUI mode, they are disabled. Listeners writing to a file keep
+    writing, as CSV, without bodies, headers, sub results and assertions.
+    """
+    testclass = "ResultCollector"
+
+    def condition(self, e):
+        return e.attrib.get("testclass") == "ResultCollector"
+
+    def callback(self, e):
+        name = e.attrib.get("testname", e.attrib.get("guiclass"))
+        changes = []
+
+        filename = ""
+        for prop in e:
+            if prop.attrib.get("name") == "filename":
+                filename = prop.text or ""
+        if e.attrib.get("guiclass") in GUI_LISTENERS and filename == "" \
+                and e.attrib.get("enabled") != "false":
+            e.attrib["enabled"] = "false"
+            changes.append("disabled")
+
+        for config in e.iter("value"):
+            if config.attrib.get("class") != "SampleSaveConfiguration":
+                continue
+            saved_before = [f.tag for f in config if f.text == "true"]
+            removed = []
+            for field in config:
+                if field.tag == "assertionsResultsToSave":
+                    field.text = "0"
+                elif field.tag == "xml":
+                    field.text = "false"
+                elif field.tag not in LEAN_FIELDS and field.text == "true":
+                    field.text = "false"
+                    removed.append(field.tag)
+            saved_after = [f.tag for f in config if f.text == "true"]
+            if len(removed) > 0:
+                changes.append(
+                    f"per-sample fields {len(saved_before)} -> "
+                    f"{len(saved_after)}, no longer saving "
+                    + ", ".join(removed))
+
+        if len(changes) > 0:
+            logging.info(f"Lean results, {name}: " + "; ".join(changes))
+        return e
+
+
+def make_callbacks(args):
     callbacks = []
 
     #
@@ -229,21 +750,21 @@ def main(args, input_file, output_file):
     # Test duration
     #
     if args.duration is not None:
-        cb = jr.ReplaceDuration(args.duration)
+        cb = ReplaceDuration(args.duration)
         callbacks.append(cb)
 
     #
     # Loop count
     #
     if args.loops is not None:
-        cb = jr.ReplaceLoopCount(args.loops)
+        cb = ReplaceLoopCount(args.loops)
         callbacks.append(cb)
 
     #
     # Replace HTTP Sampler path
     #
     if args.name2path:
-        cb = jr.NameToPath(args.prefix_method)
+        cb = NameToPath(args.prefix_method)
         callbacks.append(cb)
 
     #
@@ -267,13 +788,125 @@ def main(args, input_file, output_file):
         cb = ReplaceProtocol(args.protocol)
         callbacks.append(cb)
 
+    #
+    # HTTP connection policy
+    #
+    policy = ConnectionPolicy(
+        keepalive=True if args.keepalive else None,
+        implementation=args.http_implementation,
+        connect_timeout=args.connect_timeout,
+        response_timeout=args.response_timeout,
+        embedded_resources=False if args.no_embedded else None,
+    )
+    if any(value is not None for value in policy.config().values()):
+        callbacks.append(policy)
+
+    #
+    # Lean results
+    #
+    if args.lean:
+        cb = LeanResults()
+        callbacks.append(cb)
+
+    return callbacks
+
+
+MANIFEST_FILE = ".jmx-tools-manifest.json"
+
+
+def manifest_key(input_file, callbacks):
+    config = [dict(callback=type(cb).__name__, **cb.config())
+              for cb in callbacks]
+    key = json.dumps(dict(
+        input=utils.file_hash(input_file),
+        callbacks=config,
+        version=utils.tool_version(),
+    ), sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def manifest_dir(args):
+    if args.output is None:
+        if path.isdir(args.input):
+            return args.input
+        return path.dirname(args.input)
+    if path.isdir(args.input) or path.isdir(args.output):
+        return args.output
+    return path.dirname(args.output)
+
+
+def manifest_entry(args, output_file, key):
+    # The manifest entry of the output if the same input and configuration
+    # produced it, and the output was not modified since
+    entry = args.manifest.get(path.normpath(output_file))
+    if entry is not None and entry["key"] == key and path.isfile(output_file) \
+            and entry.get("output_hash") == utils.file_hash(output_file):
+        return entry
+    return None
+
+
+@utils.with_mux
+def replace_file(args, input_file, output_file):
+    callbacks = make_callbacks(args)
+
+    #
+    # Skip if the output is up to date
+    #
+    key = manifest_key(input_file, callbacks)
+    entry = manifest_entry(args, output_file, key)
+    if entry is not None:
+        logging.info(f"{output_file} is up to date, skipping")
+        return entry
 
     #
     # Process and save output
     #
-    xml = walk_etree(input_file, callbacks)
-    utils.prepare_write(output_file)
-    xml.write(output_file, encoding="utf-8")
+    if args.stream:
+        stream_etree(input_file, output_file, callbacks)
+    else:
+        xml = walk_etree(input_file, callbacks)
+        utils.prepare_write(output_file)
+        xml.write(output_file, encoding="utf-8")
+    return dict(key=key, output_hash=utils.file_hash(output_file))
+
+
+def main(args, process=replace_file):
+    """Replace every input file, skipping the outputs that are up to date.
+
+    `process(args, on_result)` writes the outputs and reports the manifest
+    entry of each one, see `replace_file`.
+    """
+    #
+    # Load the manifest of the previous run
+    #
+    root = manifest_dir(args)
+    manifest_file = path.join(root, MANIFEST_FILE)
+    manifest = {}
+    if path.isfile(manifest_file):
+        with open(manifest_file, encoding="utf-8") as fp:
+            manifest = json.load(fp)["files"]
+
+    args.manifest = {}
+    if not args.rebuild:
+        args.manifest = {path.normpath(path.join(root, file)): entry
+                         for file, entry in manifest.items()}
+
+    def on_result(input_file, output_file, entry):
+        manifest[path.relpath(output_file, root or curdir)] = entry
+
+    #
+    # Load the postman collection once,
+    # the worker processes inherit or reload the cached index
+    #
+    if args.postman_file:
+        load_postman_index(args.postman_file)
+
+    try:
+        process(args, on_result=on_result)
+    finally:
+        utils.prepare_write(manifest_file)
+        with open(manifest_file, "w", encoding="utf-8") as fp:
+            json.dump(dict(files=manifest), fp, indent=2, sort_keys=True)
 
 
 def add_args(parser):
@@ -296,6 +929,46 @@ def add_args(parser):
         help="Prefix HTTP samplers name with method when using name2path",
         action="store_true",
     )
+    parser.add_argument(
+        "--keepalive",
+        help="Use keep-alive in every HTTP sampler",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--http-implementation",
+        help="HTTP implementation of every HTTP sampler (e.g. HttpClient4)",
+    )
+    parser.add_argument("--connect-timeout", type=int, metavar="MS",
+                        help="Connect timeout of every HTTP sampler")
+    parser.add_argument("--response-timeout", type=int, metavar="MS",
+                        help="Response timeout of every HTTP sampler")
+    parser.add_argument(
+        "--no-embedded",
+        help="Don't download embedded resources (images, scripts...)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--lean",
+        help="Disable GUI listeners and save only the columns "
+        "needed for the summary",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stream",
+        help="Process the file incrementally, for very large JMX files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--jobs", "-j",
+        help="Number of files processed in parallel (default: CPU count)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--rebuild",
+        help="Ignore the manifest, process every file again",
+        action="store_true",
+    )
     parser.add_argument(
         "--output", "-o", help="output", metavar="output", required=False, default=None
     )
@@ -1,12 +1,23 @@
 import sys
 import logging
 import json
-from os import remove, walk, makedirs
+import hashlib
+import time
+from os import remove, replace, walk, makedirs, cpu_count, killpg
+from signal import signal, getsignal, raise_signal, SIGINT, SIGTERM, SIG_DFL
 from shutil import rmtree
 from copy import copy
-from subprocess import run, Popen
+from subprocess import run, Popen, PIPE, STDOUT
+from threading import Thread, Condition, Lock, current_thread, main_thread
 from os import path, environ
 import pandas as pd
+from .jtl import collect_jtl, summarize, save_histograms, get_histogram_file
+from .live import LiveMonitor
+from .engines import EnginePool, REMOTE_PROPERTIES
+from .resources import ResourceMonitor, get_resources_file
+from .jvm import plan_jvm, log_plan, available_memory_mb
+from . import utils
+from .utils import find_jmx
 
 if "JMETER_PATH" not in environ:
     logging.warning(
@@ -33,63 +44,134 @@ def get_summary_file(jmx_file):
     return path.join(dash, "statistics.json")
 
 
-def get_jmeter_cmd(jmx_file, jmeter_path=JMETER_PATH):
+def get_jmeter_cmd(jmx_file, jmeter_path=JMETER_PATH, dashboard=True,
+                   remote=None):
     cmd = [
         jmeter_path,
         "-n",  # No GUI
         "-t", jmx_file,
         "-l", get_log_file(jmx_file),  # Jmeter log file
-        "-e",  # Generate summary at the end
-        "-o", get_dash_folder(jmx_file),
     ]
+    if remote is not None:
+        # Run on a warm engine, samples are sent back to this client
+        cmd.extend(["-R", remote, *REMOTE_PROPERTIES])
+    if dashboard:
+        cmd.extend([
+            "-e",  # Generate summary at the end
+            "-o", get_dash_folder(jmx_file),
+        ])
     return cmd
 
 
-def main_directory(args):
-    #
-    # Search for jmx files
-    #
-    jmx_files = []
-    for (root, _, files) in walk(args.input):
-        jmx_files.extend([path.join(root, file) for file in files
-                          if file.endswith(".jmx")])
-    jmx_files = sorted(jmx_files)
+def test_name(jmx_file):
+    return path.splitext(path.relpath(jmx_file))[0]
 
-    #
-    # Map to output files
-    #
-    output_files = []
-    output_root = args.output
-    for jmx_file in jmx_files:
-        relpath = path.relpath(jmx_file)
-        output_file = path.join(output_root, jmx_file.replace(".jmx", ".csv"))
-        output_files.append(output_file)
 
-    #
-    # Recursion, run the main function again
-    # but with different inputs
-    #
-    for jmx_file, output_file in zip(jmx_files, output_files):
-        main(args, jmx_file, output_file)
+def input_jmx_files(input_file):
+    if path.isdir(input_file):
+        return [f for f in find_jmx(input_file) if f.endswith(".jmx")]
+    return [input_file]
 
 
-def main(args, jmx_file=None, output_file=None):
-    if jmx_file is None:
-        jmx_file = args.input
-    if output_file is None:
-        output_file = args.output
+def plan_tests(args, jmx_files):
+    # With --heap auto, plan the JVM of each test once. Tests that cannot
+    # be planned are left out, they fail when they are scheduled
+    plans = {}
+    if args.heap == "auto":
+        for jmx_file in jmx_files:
+            try:
+                plans[jmx_file] = plan_jvm(jmx_file)
+            except RuntimeError:
+                continue
+    return plans
 
-    #
-    # Check if the input is a directory
-    # Run in directory mode
-    #
-    if path.isdir(jmx_file):
-        if not path.exists(output_file):
-            makedirs(output_file)
-        assert path.isdir(
-            output_file), "Both input and output must be directory"
-        return main_directory(args)
 
+def engine_env(args, plans):
+    # Engines run every test, with --heap auto they are sized for the largest
+    if args.heap == "auto":
+        if len(plans) == 0:
+            return {}
+        plan = max(plans.values(), key=lambda plan: plan.heap_mb)
+        log_plan("engines", plan)
+        return plan.env()
+    if args.heap is not None:
+        return dict(HEAP=f"-Xms{args.heap}g -Xmx{args.heap}g")
+    return {}
+
+
+def heap_cost(args, plan):
+    # Heap (GB) reserved by one JVM, Jmeter's default is 1GB
+    if plan is not None:
+        return plan.heap_gb
+    return args.heap if args.heap is not None else 1
+
+
+_print_lock = Lock()
+
+
+def locked_print(text):
+    with _print_lock:
+        print(text, flush=True)
+
+
+def relay_output(stream, prefix):
+    for line in stream:
+        with _print_lock:
+            sys.stdout.write(f"[{prefix}] {line}")
+            sys.stdout.flush()
+
+
+def terminate(proc, signum=SIGTERM):
+    # Jmeter's launcher script does not forward signals to the JVM,
+    # stop the whole process group (see `start_new_session`)
+    try:
+        killpg(proc.pid, signum)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+# Jmeter processes started in their own session, they do not receive
+# the Ctrl-C of the terminal
+_sessions = set()
+_sessions_lock = Lock()
+_previous_handlers = {}
+
+
+def _forward_signal(signum, frame):
+    with _sessions_lock:
+        procs = list(_sessions)
+    for proc in procs:
+        terminate(proc, signum)
+    previous = _previous_handlers[signum]
+    if callable(previous):
+        previous(signum, frame)
+    elif previous == SIG_DFL:
+        signal(signum, SIG_DFL)
+        raise_signal(signum)
+
+
+def forward_signals():
+    """Forward SIGINT and SIGTERM to the running Jmeter sessions.
+
+    The signals are then handled as before. Only the main thread can
+    install signal handlers, elsewhere this does nothing.
+    """
+    if current_thread() is not main_thread():
+        return
+    for signum in (SIGINT, SIGTERM):
+        if signum not in _previous_handlers:
+            _previous_handlers[signum] = getsignal(signum)
+            signal(signum, _forward_signal)
+
+
+def run_test(args, jmx_file, output_file, prefix=None, engine=None,
+             plan=None):
+    """Run one test and write its summary, return Jmeter's exit code.
+
+    If `prefix` is given, every output line of Jmeter is prefixed with it.
+    If `engine` is given, the test runs on that `engines.Engine`.
+    With `--heap auto`, `plan` is the test's `JvmPlan` if already known.
+    """
     # Run environment
     run_env = copy(environ)
 
@@ -101,8 +183,16 @@ def main(args, jmx_file=None, output_file=None):
     #
     # Check if we need to set the heap size
     #
-    if args.heap is not None:
-        heap = args.heap
+    heap = args.heap
+    if heap == "auto":
+        if plan is None:
+            plan = plan_jvm(jmx_file)
+        log_plan(test_name(jmx_file), plan)
+        run_env.update(plan.env())
+        heap = plan.heap_gb
+        logging.info(f"Setting Java heap: {run_env['HEAP']}, "
+                     f"GC: {run_env['GC_ALGO']}")
+    elif heap is not None:
         max_metaspace_size = int(heap / 4 * 1024)
         run_env["HEAP"] = f"-Xms{heap}g -Xmx{heap}g -XX:MaxMetaspaceSize={max_metaspace_size}m"
         logging.info(f"Setting Java heap: {run_env['HEAP']}")
@@ -120,31 +210,410 @@ def main(args, jmx_file=None, output_file=None):
         except Exception:
             pass
 
+    #
+    # Without the dashboard Jmeter appends to an existing log instead of
+    # refusing it, the summary would mix in the samples of earlier runs
+    #
+    log_file = get_log_file(jmx_file)
+    if args.no_dashboard and path.exists(log_file) \
+            and path.getsize(log_file) > 0:
+        logging.error(f"{log_file} already exists, "
+                      "use --force to run the test again")
+        return 1
+
     #
     # Run jmeter
     #
-    cmd = get_jmeter_cmd(jmx_file)
-    proc = Popen(cmd,
-                 stdout=sys.stdout,
-                 stderr=sys.stderr,
-                 env=run_env)
-    proc.communicate()
+    remote = engine.address if engine is not None else None
+    cmd = get_jmeter_cmd(jmx_file, dashboard=not args.no_dashboard,
+                         remote=remote)
+    log_offset = path.getsize(log_file) if path.exists(log_file) else 0
+    can_abort = any(threshold is not None for threshold in (
+        args.abort_error_rate, args.abort_p95, args.abort_p99))
+    popen_kwargs = dict(env=run_env, start_new_session=can_abort)
+    if prefix is None:
+        proc = Popen(cmd,
+                     stdout=sys.stdout,
+                     stderr=sys.stderr,
+                     **popen_kwargs)
+    else:
+        proc = Popen(cmd,
+                     stdout=PIPE,
+                     stderr=STDOUT,
+                     text=True,
+                     bufsize=1,
+                     **popen_kwargs)
+
+    if can_abort:
+        with _sessions_lock:
+            _sessions.add(proc)
+
+    monitor = None
+    resources = None
+    try:
+        #
+        # Print statistics while the test is running
+        #
+        if args.live is not None:
+            monitor = LiveMonitor(
+                log_file,
+                interval=args.live,
+                name=prefix or test_name(jmx_file),
+                offset=log_offset,
+                max_error_pct=args.abort_error_rate,
+                max_p95=args.abort_p95,
+                max_p99=args.abort_p99,
+                min_samples=args.abort_min_samples,
+                on_abort=lambda reason: terminate(proc),
+                write=locked_print,
+            )
+            monitor.start()
+
+        #
+        # Sample the resources of the load generator
+        #
+        if args.monitor is not None:
+            resources = ResourceMonitor(proc.pid, args.monitor,
+                                        get_resources_file(output_file))
+            resources.start()
+
+        if prefix is None:
+            proc.communicate()
+        else:
+            relay_output(proc.stdout, prefix)
+            proc.wait()
+    finally:
+        #
+        # Never leave Jmeter behind, even if interrupted
+        #
+        if proc.poll() is None:
+            if can_abort:
+                terminate(proc)
+            else:
+                proc.terminate()
+            proc.wait()
+        with _sessions_lock:
+            _sessions.discard(proc)
+        if monitor is not None:
+            monitor.stop()
+        if resources is not None:
+            resources.stop()
 
     #
     # Error check
     #
     if proc.returncode != 0:
-        logging.error("Something bad has happened, see the log above.")
-        sys.exit(proc.returncode)
-        return
+        return proc.returncode
 
     #
-    # Generate summary file
+    # Generate summary file, from Jmeter's dashboard
+    # or by aggregating the log file directly.
+    # The log is only read if the summary or the histograms need it
     #
-    summary_file = get_summary_file(jmx_file)
-    with open(summary_file) as f:
-        data = json.load(f)
+    stats = None
+    if args.no_dashboard or args.histogram:
+        stats = collect_jtl(log_file)
+    if args.no_dashboard:
+        data = summarize(stats)
+    else:
+        summary_file = get_summary_file(jmx_file)
+        with open(summary_file) as f:
+            data = json.load(f)
     df = pd.DataFrame(list(data.values()))
     df = df.sort_values(by=["sampleCount", "transaction"])
+    if resources is not None:
+        saturation = resources.saturation(heap)
+        for column, value in saturation.items():
+            df[column] = value
+        if saturation.get("generatorSaturated"):
+            logging.warning(
+                f"{test_name(jmx_file)}: the load generator was saturated, "
+                f"see {get_resources_file(output_file)}")
     df.to_csv(output_file, index=False)
     logging.info(f"Output written to {output_file}")
+
+    #
+    # Mergeable histograms, to combine runs with `jmx-tools merge`
+    #
+    if args.histogram:
+        save_histograms(stats, get_histogram_file(output_file))
+
+    if args.store is not None:
+        from .store import Store
+        store = Store(args.store)
+        try:
+            store.ingest(log_file, jmx_file=jmx_file, test=test_name(jmx_file))
+        finally:
+            store.close()
+    return 0
+
+
+def run_scheduled(args, tests, pool=None, on_result=None, plans=None):
+    """Run the (jmx_file, output_file) pairs concurrently.
+
+    Tests are started in order as long as there are less than
+    `--parallel` running, and their heap and CPU fit in the budgets.
+    A test that does not fit in the budgets alone is run by itself.
+    With `--heap auto`, a test is planned when it starts, against the
+    available memory minus the heap of the running tests.
+    With an engine `pool`, each test waits for an idle engine.
+    `on_result(jmx_file, output_file, returncode)` is called from the
+    test's thread when it ends. `plans` are the JVM plans already made
+    with `plan_tests`. Returns the exit code of each test.
+    """
+    parallel = max(args.parallel, 1)
+    heap_budget = args.heap_budget
+    cpu_budget = args.cpu_budget or cpu_count() or 1
+    cpu_cost = args.cpus_per_test
+
+    condition = Condition()
+    used = dict(count=0, heap=0, cpu=0)
+    results = {}
+    plans = dict(plans or {})
+
+    def fits(heap):
+        if used["count"] == 0:
+            return True
+        if used["count"] >= parallel:
+            return False
+        if heap_budget is not None and used["heap"] + heap > heap_budget:
+            return False
+        return used["cpu"] + cpu_cost <= cpu_budget
+
+    def worker(jmx_file, output_file, heap, plan):
+        prefix = test_name(jmx_file) if parallel > 1 else None
+        try:
+            if pool is None:
+                returncode = run_test(args, jmx_file, output_file, prefix,
+                                      plan=plan)
+            else:
+                engine = pool.acquire()
+                returncode = -1
+                try:
+                    returncode = run_test(args, jmx_file, output_file,
+                                          prefix, engine, plan)
+                finally:
+                    pool.release(engine, healthy=returncode == 0)
+        except Exception:
+            logging.exception(f"{test_name(jmx_file)} failed")
+            returncode = -1
+        if on_result is not None:
+            on_result(jmx_file, output_file, returncode)
+        with condition:
+            results[jmx_file] = returncode
+            used["count"] -= 1
+            used["heap"] -= heap
+            used["cpu"] -= cpu_cost
+            condition.notify_all()
+
+    def plan_test(jmx_file):
+        # With --heap auto, plan against the memory left by the heaps of
+        # the running tests, MemAvailable does not count the part of their
+        # heap they have not touched yet. Engines are planned once
+        if args.heap != "auto":
+            return None
+        if jmx_file in plans:
+            return plans[jmx_file]
+        available_mb = available_memory_mb() - used["heap"] * 1024
+        return plan_jvm(jmx_file, max(available_mb, 0))
+
+    threads = []
+    for jmx_file, output_file in tests:
+        #
+        # A test that cannot be planned while others are running waits
+        # for them, alone it fails and the others still run
+        #
+        error = None
+        with condition:
+            while True:
+                try:
+                    plan = plan_test(jmx_file)
+                except RuntimeError as e:
+                    if used["count"] == 0:
+                        error = e
+                        break
+                    condition.wait()
+                    continue
+                heap = heap_cost(args, plan)
+                if fits(heap):
+                    break
+                condition.wait()
+            if error is None:
+                used["count"] += 1
+                used["heap"] += heap
+                used["cpu"] += cpu_cost
+            else:
+                results[jmx_file] = -1
+        if error is not None:
+            logging.error(f"{test_name(jmx_file)} failed: {error}")
+            if on_result is not None:
+                on_result(jmx_file, output_file, -1)
+            continue
+        thread = Thread(target=worker,
+                        args=(jmx_file, output_file, heap, plan))
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+    return [results[jmx_file] for jmx_file, _ in tests]
+
+
+JOURNAL_FILE = ".jmx-tools-journal.json"
+
+
+class RunJournal:
+    """Outcome of each test of a directory run, to resume it later.
+
+    A test is done when it passed with the same JMX file and options,
+    and its summary is still the one it wrote. The journal is written
+    after each test (atomically), so an interrupted run keeps the tests
+    that finished.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.root = path.dirname(file)
+        self.lock = Lock()
+        self.entries = {}
+        if path.isfile(file):
+            with open(file, encoding="utf-8") as fp:
+                self.entries = json.load(fp)["tests"]
+
+    @staticmethod
+    def key(args, jmx_file):
+        options = dict(
+            jmx=utils.file_hash(jmx_file),
+            heap=args.heap,
+            no_dashboard=args.no_dashboard,
+            version=utils.tool_version(),
+        )
+        key = json.dumps(options, sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def is_done(self, output_file, key):
+        entry = self.entries.get(path.relpath(output_file, self.root))
+        return entry is not None \
+            and entry["returncode"] == 0 \
+            and entry["key"] == key \
+            and path.isfile(output_file) \
+            and entry["output_hash"] == utils.file_hash(output_file)
+
+    def record(self, output_file, jmx_file, key, returncode):
+        output_hash = None
+        if returncode == 0 and path.isfile(output_file):
+            output_hash = utils.file_hash(output_file)
+        entry = dict(
+            jmx=jmx_file,
+            key=key,
+            returncode=returncode,
+            output_hash=output_hash,
+            finished=time.time(),
+        )
+        with self.lock:
+            self.entries[path.relpath(output_file, self.root)] = entry
+            utils.prepare_write(self.file)
+            tmp_file = f"{self.file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as fp:
+                json.dump(dict(tests=self.entries), fp, indent=2,
+                          sort_keys=True)
+            replace(tmp_file, self.file)
+
+
+def main_directory(args, pool=None, plans=None):
+    #
+    # Search for jmx files
+    #
+    jmx_files = []
+    for (root, _, files) in walk(args.input):
+        jmx_files.extend([path.join(root, file) for file in files
+                          if file.endswith(".jmx")])
+    jmx_files = sorted(jmx_files)
+
+    #
+    # Map to output files
+    #
+    output_files = []
+    output_root = args.output
+    for jmx_file in jmx_files:
+        output_file = path.join(output_root, jmx_file.replace(".jmx", ".csv"))
+        output_files.append(output_file)
+
+    #
+    # Skip the tests that already passed with the same plan and options
+    #
+    tests = list(zip(jmx_files, output_files))
+    journal = RunJournal(path.join(output_root, JOURNAL_FILE))
+    keys = {jmx_file: journal.key(args, jmx_file) for jmx_file in jmx_files}
+    if args.resume:
+        done = [(jmx_file, output_file) for jmx_file, output_file in tests
+                if journal.is_done(output_file, keys[jmx_file])]
+        for jmx_file, _ in done:
+            logging.info(f"{test_name(jmx_file)} already passed, skipping")
+        tests = [test for test in tests if test not in done]
+        # Logs of interrupted or failed tests are partial, start them over
+        args = copy(args)
+        args.force = True
+
+    def on_result(jmx_file, output_file, returncode):
+        journal.record(output_file, jmx_file, keys[jmx_file], returncode)
+
+    #
+    # Run the tests, failed tests don't stop the others
+    #
+    returncodes = run_scheduled(args, tests, pool, on_result, plans)
+    failed = [jmx_file for (jmx_file, _), returncode
+              in zip(tests, returncodes) if returncode != 0]
+    for jmx_file in failed:
+        logging.error(f"Test failed: {jmx_file}")
+    if len(failed) > 0:
+        logging.error(f"{len(failed)} of {len(tests)} tests failed")
+        sys.exit(1)
+
+
+def main(args, jmx_file=None, output_file=None, pool=None, plans=None):
+    forward_signals()
+
+    #
+    # Start the warm engines, shared by all the tests of the run
+    #
+    if args.engines is not None and pool is None:
+        plans = plan_tests(args, input_jmx_files(args.input))
+        with EnginePool(args.engines, engine_env(args, plans)) as pool:
+            return main(args, jmx_file, output_file, pool, plans)
+
+    if jmx_file is None:
+        jmx_file = args.input
+    if output_file is None:
+        output_file = args.output
+
+    #
+    # Check if the input is a directory
+    # Run in directory mode
+    #
+    if path.isdir(jmx_file):
+        if not path.exists(output_file):
+            makedirs(output_file)
+        assert path.isdir(
+            output_file), "Both input and output must be directory"
+        return main_directory(args, pool, plans)
+
+    if pool is None:
+        returncode = run_test(args, jmx_file, output_file)
+    else:
+        [returncode] = run_scheduled(args, [(jmx_file, output_file)], pool,
+                                     plans=plans)
+    if returncode != 0:
+        logging.error("Something bad has happened, see the log above.")
+        sys.exit(returncode)
+
+
+def main_batch(batch_args):
+    """Run a batch of run actions on the same warm engines."""
+    args = batch_args[0]
+    jmx_files = [jmx_file for args_i in batch_args
+                 for jmx_file in input_jmx_files(args_i.input)]
+    plans = plan_tests(args, jmx_files)
+    with EnginePool(args.engines, engine_env(args, plans)) as pool:
+        for args_i in batch_args:
+            main(args_i, pool=pool, plans=plans)
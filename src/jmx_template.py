@@ -0,0 +1,178 @@
+from xml.etree import cElementTree as ET
+# Serializer helper, not re-exported by cElementTree
+from xml.etree.ElementTree import _escape_cdata
+from dataclasses import dataclass
+from io import BytesIO
+from os import replace
+from uuid import uuid4
+import logging
+import re
+
+from . import jmx_replace as jr
+from . import utils
+
+
+#
+# Callbacks that only rewrite the text of a leaf property,
+# mapped to the property they rewrite
+#
+SLOTS = {
+    jr.ReplaceCCU: "ThreadGroup.num_threads",
+    jr.ReplaceDuration: "ThreadGroup.duration",
+    jr.ReplaceLoopCount: "LoopController.loops",
+    jr.ReplaceBearer: "Header.value",
+    jr.ReplaceDomain: "HTTPSampler.domain",
+    jr.ReplaceProtocol: "HTTPSampler.protocol",
+}
+
+
+@dataclass
+class Slot:
+    name: str
+    tag: str
+    text: str
+    open_tag: bytes
+    close_tag: bytes
+
+    def render(self, text):
+        if not text:
+            return self.open_tag[:-1] + b" />"
+        text = _escape_cdata(text)
+        text = text.encode("utf-8", "xmlcharrefreplace")
+        return self.open_tag + text + self.close_tag
+
+
+class JmxTemplate:
+    """A JMX file parsed and serialized once.
+
+    The properties listed in `SLOTS` are cut out of the serialized bytes,
+    each variant is rendered by splicing the new values back in,
+    without parsing or serializing XML again.
+    The output is the same as `walk_etree` + `ElementTree.write`.
+    """
+
+    def __init__(self, file):
+        tree = ET.parse(file)
+
+        #
+        # Find the mutable elements
+        #
+        elements = []
+        names = set(SLOTS.values()) - {"Header.value"}
+        for element in tree.iter():
+            name = element.get("name")
+            if element.tag == "collectionProp" and name == "HeaderManager.headers":
+                elements.extend(
+                    subel for subel in element.iter()
+                    if subel.get("name") == "Header.value" and len(subel) == 0
+                )
+            elif name in names and len(element) == 0:
+                elements.append(element)
+
+        #
+        # Replace them with unique markers and serialize
+        #
+        nonce = uuid4().hex
+        texts = []
+        for idx, element in enumerate(elements):
+            texts.append(element.text)
+            element.text = f"jmxslot{nonce}n{idx}x"
+        data = BytesIO()
+        tree.write(data, encoding="utf-8")
+        parts = re.split(rb"jmxslot" + nonce.encode() + rb"n(\d+)x",
+                         data.getvalue())
+
+        #
+        # Split the serialized bytes into static chunks and slots
+        #
+        self.chunks = [parts[0]]
+        self.slots = []
+        for i in range(1, len(parts), 2):
+            element = elements[int(parts[i])]
+            before = self.chunks[-1]
+            after = parts[i + 1]
+            open_start = before.rindex(b"<")
+            close_tag = f"</{element.tag}>".encode()
+            assert after.startswith(close_tag)
+            self.slots.append(Slot(
+                name=element.get("name"),
+                tag=element.tag,
+                text=texts[int(parts[i])],
+                open_tag=before[open_start:],
+                close_tag=close_tag,
+            ))
+            self.chunks[-1] = before[:open_start]
+            self.chunks.append(after[len(close_tag):])
+
+    @staticmethod
+    def supports(callbacks):
+        return all(type(cb) in SLOTS for cb in callbacks)
+
+    def render(self, callbacks):
+        assert self.supports(callbacks)
+
+        #
+        # Run the callbacks on detached copies of the slots,
+        # once per distinct slot
+        #
+        values = {}
+        for slot in self.slots:
+            key = (slot.name, slot.tag, slot.text)
+            if key in values:
+                continue
+            element = ET.Element(slot.tag, name=slot.name)
+            element.text = slot.text
+            for callback in callbacks:
+                if SLOTS[type(callback)] == slot.name:
+                    element = callback.callback(element)
+            values[key] = slot.render(element.text)
+
+        parts = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            parts.append(values[slot.name, slot.tag, slot.text])
+            parts.append(chunk)
+        return b"".join(parts)
+
+    def write(self, output_file, callbacks):
+        # Render first, a failing variant must not leave an empty output
+        data = self.render(callbacks)
+        utils.prepare_write(output_file)
+        tmp_file = f"{output_file}.tmp"
+        with open(tmp_file, "wb") as fp:
+            fp.write(data)
+        replace(tmp_file, output_file)
+
+
+def main(batch_args):
+    """Run a batch of replace actions, parsing each input only once.
+
+    Outputs go through the manifest of `jmx_replace.main`. Actions that
+    cannot be rendered from a template, or with `--jobs` above 1, are
+    run by `jmx_replace.main` and its process pool instead.
+    """
+    templates = {}
+
+    def render(args, on_result=None):
+        callbacks = jr.make_callbacks(args)
+        for input_file, output_file in utils.mux_input_output(
+                args.input, args.output):
+            key = jr.manifest_key(input_file, callbacks)
+            entry = jr.manifest_entry(args, output_file, key)
+            if entry is not None:
+                logging.info(f"{output_file} is up to date, skipping")
+            else:
+                if input_file not in templates:
+                    templates[input_file] = JmxTemplate(input_file)
+                templates[input_file].write(output_file, callbacks)
+                entry = dict(key=key,
+                             output_hash=utils.file_hash(output_file))
+            if on_result is not None:
+                on_result(input_file, output_file, entry)
+
+    for args in batch_args:
+        callbacks = jr.make_callbacks(args)
+        if args.stream or (args.jobs or 1) > 1 \
+                or not JmxTemplate.supports(callbacks):
+            jr.main(args)
+        else:
+            jr.main(args, render)
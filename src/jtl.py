@@ -0,0 +1,300 @@
+from collections import Counter
+from os import path
+import json
+import logging
+import math
+import numpy as np
+import pandas as pd
+
+JTL_COLUMNS = ["timeStamp", "elapsed", "label", "success",
+               "bytes", "sentBytes"]
+
+
+class LabelStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.elapsed_sum = 0
+        self.elapsed_min = None
+        self.elapsed_max = None
+        self.start = None
+        self.end = None
+        self.bytes = 0
+        self.sent_bytes = 0
+        # response time -> number of samples
+        self.elapsed = Counter()
+        self.histogram = LatencyHistogram()
+
+    def update(self, group):
+        elapsed = group["elapsed"].to_numpy()
+        end = group["timeStamp"].to_numpy() + elapsed
+        self.count += len(group)
+        self.errors += int((~group["success"]).sum())
+        self.elapsed_sum += int(elapsed.sum())
+        self.bytes += int(group["bytes"].sum())
+        self.sent_bytes += int(group["sentBytes"].sum())
+        self.elapsed_min = _min(self.elapsed_min, int(elapsed.min()))
+        self.elapsed_max = _max(self.elapsed_max, int(elapsed.max()))
+        self.start = _min(self.start, int(group["timeStamp"].min()))
+        self.end = _max(self.end, int(end.max()))
+        values, counts = np.unique(elapsed, return_counts=True)
+        self.elapsed.update(dict(zip(values.tolist(), counts.tolist())))
+        self.histogram.add(elapsed)
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.elapsed_sum += other.elapsed_sum
+        self.bytes += other.bytes
+        self.sent_bytes += other.sent_bytes
+        self.elapsed_min = _min(self.elapsed_min, other.elapsed_min)
+        self.elapsed_max = _max(self.elapsed_max, other.elapsed_max)
+        self.start = _min(self.start, other.start)
+        self.end = _max(self.end, other.end)
+        self.elapsed.update(other.elapsed)
+        self.histogram.merge(other.histogram)
+
+    def percentiles(self, ps):
+        keys = sorted(self.elapsed)
+        values = np.array(keys, dtype=np.float64)
+        cumulative = np.cumsum([self.elapsed[k] for k in keys])
+
+        def nth(i):
+            # i-th smallest sample (0 based)
+            return values[np.searchsorted(cumulative, i + 1)]
+
+        n = self.count
+        results = []
+        for p in ps:
+            pos = p * (n + 1) / 100
+            if pos < 1:
+                results.append(nth(0))
+            elif pos >= n:
+                results.append(nth(n - 1))
+            else:
+                lower = nth(int(pos) - 1)
+                upper = nth(int(pos))
+                results.append(lower + (pos - int(pos)) * (upper - lower))
+        return [float(r) for r in results]
+
+    def to_dict(self, transaction):
+        duration = max(self.end - self.start, 1) / 1000
+        median, pct1, pct2, pct3 = self.percentiles([50, 90, 95, 99])
+        return {
+            "transaction": transaction,
+            "sampleCount": self.count,
+            "errorCount": self.errors,
+            "errorPct": self.errors / self.count * 100,
+            "meanResTime": self.elapsed_sum / self.count,
+            "medianResTime": median,
+            "minResTime": self.elapsed_min,
+            "maxResTime": self.elapsed_max,
+            "pct1ResTime": pct1,
+            "pct2ResTime": pct2,
+            "pct3ResTime": pct3,
+            "throughput": self.count / duration,
+            "receivedKBytesPerSec": self.bytes / 1024 / duration,
+            "sentKBytesPerSec": self.sent_bytes / 1024 / duration,
+        }
+
+
+class LatencyHistogram:
+    """Log bucketed histogram of response times, with a fixed relative error.
+
+    A value `v` goes into the bucket `ceil(log(v) / log(gamma))`, every
+    value of a bucket is within `relative_error` of the bucket's
+    representative value. Memory only depends on the range of the values
+    (about 700 buckets from 1ms to 1h at 1%), histograms with the same
+    relative error are merged by adding the bucket counts.
+    """
+
+    def __init__(self, relative_error=0.01):
+        self.relative_error = relative_error
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = Counter()
+        self.count = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        indexes = np.ceil(np.log(np.maximum(values, 1)) / self.log_gamma)
+        indexes, counts = np.unique(indexes.astype(np.int64), return_counts=True)
+        self.buckets.update(dict(zip(indexes.tolist(), counts.tolist())))
+        self.count += len(values)
+
+    def merge(self, other):
+        assert self.relative_error == other.relative_error, \
+            "Cannot merge histograms with different relative errors"
+        self.buckets.update(other.buckets)
+        self.count += other.count
+
+    def bucket_value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def percentile(self, p):
+        if self.count == 0:
+            return float("nan")
+        rank = max(math.ceil(p / 100 * self.count), 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return self.bucket_value(index)
+        return self.bucket_value(max(self.buckets))
+
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def read_jtl(jtl_file, chunksize=500_000):
+    """Read the columns needed for the statistics, chunk by chunk."""
+    chunks = pd.read_csv(
+        jtl_file,
+        usecols=lambda column: column in JTL_COLUMNS,
+        dtype={"label": str},
+        chunksize=chunksize,
+    )
+    for chunk in chunks:
+        for column in ["bytes", "sentBytes"]:
+            if column not in chunk:
+                chunk[column] = 0
+        chunk["success"] = chunk["success"].astype(str).str.lower() == "true"
+        yield chunk
+
+
+def collect_jtl(jtl_file, chunksize=500_000):
+    """Per label `LabelStats` of a .jtl file, read in chunks."""
+    stats = {}
+    for chunk in read_jtl(jtl_file, chunksize):
+        for label, group in chunk.groupby("label", sort=False):
+            if label not in stats:
+                stats[label] = LabelStats()
+            stats[label].update(group)
+    return stats
+
+
+def summarize(stats):
+    total = LabelStats()
+    for label_stats in stats.values():
+        total.merge(label_stats)
+
+    results = {label: s.to_dict(label) for label, s in stats.items()}
+    if total.count > 0:
+        results["Total"] = total.to_dict("Total")
+    return results
+
+
+def aggregate_jtl(jtl_file, chunksize=500_000):
+    """Per label statistics of a .jtl file, in the `statistics.json` format.
+
+    The file is read in chunks, memory depends on the number of labels
+    and distinct response times, not on the number of samples.
+    Compared to Jmeter's dashboard:
+    - counts, errors, min and max are exact,
+    - mean and throughput only differ by floating point rounding,
+      errorPct by Jmeter's single precision (1e-7 relative),
+    - percentiles use Jmeter's estimator (Commons Math, legacy) over all
+      samples. Jmeter uses a sliding window of
+      `jmeter.reportgenerator.statistic_window` (20000) samples, labels
+      with more samples can differ by the latency drift during the run.
+    """
+    return summarize(collect_jtl(jtl_file, chunksize))
+
+
+#
+# Mergeable histogram files
+#
+def get_histogram_file(output_file):
+    return path.splitext(output_file)[0] + ".hist.json"
+
+
+def save_histograms(stats, file):
+    labels = {}
+    relative_error = None
+    for label, s in stats.items():
+        buckets = sorted(s.histogram.buckets.items())
+        relative_error = s.histogram.relative_error
+        labels[label] = dict(
+            count=s.count,
+            errors=s.errors,
+            elapsed_sum=s.elapsed_sum,
+            min=s.elapsed_min,
+            max=s.elapsed_max,
+            buckets=[index for index, _ in buckets],
+            counts=[count for _, count in buckets],
+        )
+    with open(file, "w", encoding="utf-8") as fp:
+        json.dump(dict(version=1, relative_error=relative_error,
+                       labels=labels), fp, separators=(",", ":"))
+
+
+def load_histograms(file):
+    with open(file, encoding="utf-8") as fp:
+        data = json.load(fp)
+    stats = {}
+    for label, item in data["labels"].items():
+        s = LabelStats()
+        s.count = item["count"]
+        s.errors = item["errors"]
+        s.elapsed_sum = item["elapsed_sum"]
+        s.elapsed_min = item["min"]
+        s.elapsed_max = item["max"]
+        s.histogram = LatencyHistogram(data["relative_error"])
+        s.histogram.buckets.update(dict(zip(item["buckets"], item["counts"])))
+        s.histogram.count = s.count
+        stats[label] = s
+    return stats
+
+
+def histogram_summary(stats, transaction):
+    # Percentiles are exact to the bucket precision,
+    # clamped to the exact min and max
+    percentiles = [
+        min(max(stats.histogram.percentile(p), stats.elapsed_min),
+            stats.elapsed_max)
+        for p in (50, 90, 95, 99)
+    ]
+    return {
+        "transaction": transaction,
+        "sampleCount": stats.count,
+        "errorCount": stats.errors,
+        "errorPct": stats.errors / stats.count * 100,
+        "meanResTime": stats.elapsed_sum / stats.count,
+        "medianResTime": percentiles[0],
+        "minResTime": stats.elapsed_min,
+        "maxResTime": stats.elapsed_max,
+        "pct1ResTime": percentiles[1],
+        "pct2ResTime": percentiles[2],
+        "pct3ResTime": percentiles[3],
+    }
+
+
+def main_merge(args):
+    merged = {}
+    for file in args.inputs:
+        for label, stats in load_histograms(file).items():
+            if label not in merged:
+                merged[label] = stats
+            else:
+                merged[label].merge(stats)
+
+    total = LabelStats()
+    for stats in merged.values():
+        total.merge(stats)
+    rows = [histogram_summary(s, label) for label, s in merged.items()]
+    if total.count > 0:
+        rows.append(histogram_summary(total, "Total"))
+
+    df = pd.DataFrame(rows)
+    df = df.sort_values(by=["sampleCount", "transaction"])
+    df.to_csv(args.output, index=False)
+    logging.info(f"Output written to {args.output}")
+    if args.histogram is not None:
+        save_histograms(merged, args.histogram)
@@ -0,0 +1,155 @@
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import List
+
+from .jmx_document import JmxDocument
+
+#
+# Memory model of a Jmeter JVM, in MB.
+# A thread keeps its variables, cookies and the last response,
+# listeners that keep every sample grow with the test length.
+#
+BASE_HEAP = 256
+HEAP_PER_THREAD = 1.0
+HEAP_PER_SAMPLER = 0.05
+HEAP_PER_BUFFERING_LISTENER = 256
+MIN_HEAP = 512
+# G1 wants room above the live set
+HEAP_HEADROOM = 1.5
+METASPACE = 256
+STACK_KB = 256
+# Code cache, GC structures, direct buffers...
+NON_HEAP_OVERHEAD = 256
+# Share of the available memory the JVM may use
+MEMORY_SHARE = 0.8
+
+# Listeners that keep the samples in memory
+BUFFERING_LISTENERS = {
+    "ViewResultsFullVisualizer",
+    "TableVisualizer",
+    "GraphVisualizer",
+    "RespTimeGraphVisualizer",
+    "AssertionVisualizer",
+    "MailerVisualizer",
+}
+
+GC_ALGO = "-XX:+UseG1GC -XX:MaxGCPauseMillis=100 -XX:G1ReservePercent=20"
+
+
+@dataclass
+class JvmPlan:
+    heap_mb: int
+    metaspace_mb: int
+    stack_kb: int
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def heap_gb(self):
+        return self.heap_mb / 1024
+
+    def env(self):
+        """Environment variables read by Jmeter's start script."""
+        return dict(
+            HEAP=f"-Xms{self.heap_mb}m -Xmx{self.heap_mb}m "
+                 f"-XX:MaxMetaspaceSize={self.metaspace_mb}m",
+            GC_ALGO=f"{GC_ALGO} -Xss{self.stack_kb}k",
+        )
+
+
+def available_memory_mb(meminfo="/proc/meminfo"):
+    with open(meminfo) as fp:
+        for line in fp:
+            key, value = line.split(":", 1)
+            if key == "MemAvailable":
+                return int(value.split()[0]) / 1024
+    raise RuntimeError(f"MemAvailable not found in {meminfo}")
+
+
+def plan_contents(jmx_file):
+    """Threads, samplers and buffering listeners of the enabled elements."""
+    doc = JmxDocument.load(jmx_file)
+
+    def enabled(element):
+        return all(e.get("enabled", "true") != "false"
+                   for e in [element, *doc.ancestors(element)])
+
+    threads = 0
+    for group in doc.thread_groups():
+        if not enabled(group):
+            continue
+        prop = doc.prop(group, "ThreadGroup.num_threads")
+        text = prop.text if prop is not None else None
+        try:
+            threads += int(text)
+        except (TypeError, ValueError):
+            raise RuntimeError(
+                f"{jmx_file}: cannot size the heap, {group.get('testname')} "
+                f"has {text!r} threads, use --heap with a number")
+
+    samplers = sum(
+        1 for testclass, elements in doc.by_testclass.items()
+        if testclass.endswith("Sampler") or testclass.endswith("SamplerProxy")
+        for element in elements if enabled(element))
+    listeners = [
+        element.get("testname") for element in doc.elements("ResultCollector")
+        if element.get("guiclass") in BUFFERING_LISTENERS and enabled(element)]
+    return threads, samplers, listeners
+
+
+def plan_jvm(jmx_file, available_mb=None):
+    """Pick heap, metaspace and thread stack for a test plan.
+
+    Raises `RuntimeError` if the threads of the plan don't fit in the
+    available memory.
+    """
+    threads, samplers, listeners = plan_contents(jmx_file)
+    if available_mb is None:
+        available_mb = available_memory_mb()
+
+    needed = (BASE_HEAP + threads * HEAP_PER_THREAD
+              + samplers * HEAP_PER_SAMPLER
+              + len(listeners) * HEAP_PER_BUFFERING_LISTENER)
+    needed = int(math.ceil(max(needed, MIN_HEAP) / 256) * 256)
+    stacks = threads * STACK_KB / 1024
+    non_heap = METASPACE + stacks + NON_HEAP_OVERHEAD
+    usable = available_mb * MEMORY_SHARE
+
+    reasons = [
+        f"{threads} threads, {samplers} samplers, "
+        f"{len(listeners)} buffering listeners",
+        f"heap needed {needed}MB = {BASE_HEAP}MB base "
+        f"+ {HEAP_PER_THREAD}MB/thread + {HEAP_PER_SAMPLER}MB/sampler "
+        f"+ {HEAP_PER_BUFFERING_LISTENER}MB/listener",
+        f"non heap {non_heap:.0f}MB = {METASPACE}MB metaspace "
+        f"+ {STACK_KB}KB stack/thread + {NON_HEAP_OVERHEAD}MB",
+        f"available {available_mb:.0f}MB, usable {usable:.0f}MB "
+        f"({MEMORY_SHARE:.0%})",
+    ]
+    if len(listeners) > 0:
+        reasons.append("listeners keeping every sample: "
+                       + ", ".join(listeners)
+                       + " (disable them for large tests)")
+
+    if needed + non_heap > usable:
+        raise RuntimeError(
+            f"{jmx_file}: {threads} threads do not fit in memory, "
+            f"{needed + non_heap:.0f}MB needed, {usable:.0f}MB usable\n"
+            + "\n".join(reasons))
+
+    # Headroom for G1 if the host has it, rounded to 256MB
+    heap = min(needed * HEAP_HEADROOM, usable - non_heap)
+    heap = max(int(heap // 256 * 256), needed)
+    reasons.append(f"heap {heap}MB")
+    return JvmPlan(heap, METASPACE, STACK_KB, reasons)
+
+
+def heap_size(value):
+    """`--heap` value: a number of GBs or auto."""
+    if value == "auto":
+        return value
+    return int(value)
+
+
+def log_plan(name, plan):
+    logging.info(f"{name}: --heap auto\n  " + "\n  ".join(plan.reasons))
@@ -0,0 +1,159 @@
+import csv
+import time
+import logging
+from collections import defaultdict
+from os import path
+from threading import Thread, Event
+
+from .jtl import LatencyHistogram
+
+
+class WindowStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.histogram = LatencyHistogram()
+
+    @property
+    def error_pct(self):
+        return self.errors / self.count * 100 if self.count > 0 else 0.0
+
+
+class LiveMonitor(Thread):
+    """Tail a growing .jtl file and print rolling statistics.
+
+    Every `interval` seconds, the throughput, error rate, p95 and p99 of
+    the samples written during the interval are printed per label.
+    If a threshold is breached by the samples of an interval (with at
+    least `min_samples` samples), `on_abort(reason)` is called once.
+    """
+
+    def __init__(self, jtl_file, interval, name,
+                 offset=0,
+                 max_error_pct=None,
+                 max_p95=None,
+                 max_p99=None,
+                 min_samples=100,
+                 on_abort=None,
+                 write=print):
+        super().__init__(daemon=True)
+        self.jtl_file = jtl_file
+        self.interval = interval
+        self.name_ = name
+        self.offset = offset
+        self.max_error_pct = max_error_pct
+        self.max_p95 = max_p95
+        self.max_p99 = max_p99
+        self.min_samples = min_samples
+        self.on_abort = on_abort
+        self.write = write
+        self.abort_reason = None
+        self.stopped = Event()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def run(self):
+        #
+        # Wait for Jmeter to create the file
+        #
+        while not path.exists(self.jtl_file):
+            if self.stopped.wait(0.5):
+                return
+
+        with open(self.jtl_file, encoding="utf-8", newline="") as fp:
+            columns = None
+            if self.offset > 0:
+                header = next(csv.reader([fp.readline()]))
+                columns = {c: i for i, c in enumerate(header)}
+                fp.seek(self.offset)
+
+            window = defaultdict(WindowStats)
+            partial = ""
+            started = time.monotonic()
+            while True:
+                stopped = self.stopped.is_set()
+
+                #
+                # Read the complete lines written so far,
+                # response times are added to the histograms once per pass
+                #
+                elapsed_values = defaultdict(list)
+                for line in iter(fp.readline, ""):
+                    line = partial + line
+                    if not line.endswith("\n"):
+                        partial = line
+                        break
+                    partial = ""
+                    row = next(csv.reader([line]), None)
+                    if not row:
+                        continue
+                    if columns is None:
+                        columns = {c: i for i, c in enumerate(row)}
+                        continue
+                    try:
+                        label = row[columns["label"]]
+                        elapsed = int(row[columns["elapsed"]])
+                        success = row[columns["success"]].lower() == "true"
+                    except (KeyError, IndexError, ValueError):
+                        continue
+                    stats = window[label]
+                    stats.count += 1
+                    stats.errors += not success
+                    elapsed_values[label].append(elapsed)
+                for label, values in elapsed_values.items():
+                    window[label].histogram.add(values)
+
+                #
+                # Report the interval
+                #
+                now = time.monotonic()
+                if now - started >= self.interval or stopped:
+                    self.report(window, now - started)
+                    window = defaultdict(WindowStats)
+                    started = now
+                if stopped:
+                    return
+                self.stopped.wait(min(1.0, self.interval))
+
+    def report(self, window, elapsed):
+        if len(window) == 0:
+            return
+        total = WindowStats()
+        for stats in window.values():
+            total.count += stats.count
+            total.errors += stats.errors
+            total.histogram.merge(stats.histogram)
+
+        lines = [f"{'label':40s} {'samples':>8s} {'tput/s':>8s} "
+                 f"{'err%':>6s} {'p95':>8s} {'p99':>8s}"]
+        rows = sorted(window.items()) + [("Total", total)]
+        for label, stats in rows:
+            lines.append(
+                f"{label[:40]:40s} {stats.count:8d} "
+                f"{stats.count / max(elapsed, 1e-3):8.1f} "
+                f"{stats.error_pct:6.2f} "
+                f"{stats.histogram.percentile(95):8.0f} "
+                f"{stats.histogram.percentile(99):8.0f}")
+        self.write("\n".join(f"[{self.name_}] {line}" for line in lines))
+
+        #
+        # Check the thresholds
+        #
+        if self.abort_reason is not None or total.count < self.min_samples:
+            return
+        p95 = total.histogram.percentile(95)
+        p99 = total.histogram.percentile(99)
+        reason = None
+        if self.max_error_pct is not None and total.error_pct > self.max_error_pct:
+            reason = f"error rate {total.error_pct:.2f}% > {self.max_error_pct}%"
+        elif self.max_p95 is not None and p95 > self.max_p95:
+            reason = f"p95 {p95:.0f}ms > {self.max_p95}ms"
+        elif self.max_p99 is not None and p99 > self.max_p99:
+            reason = f"p99 {p99:.0f}ms > {self.max_p99}ms"
+        if reason is not None:
+            self.abort_reason = reason
+            logging.error(f"{self.name_}: aborting, {reason}")
+            if self.on_abort is not None:
+                self.on_abort(reason)
@@ -0,0 +1,195 @@
+import html
+import logging
+import re
+from os import path
+
+import pandas as pd
+
+from . import utils
+
+# Last integer of the file name: tests/test-200.jmx.csv -> 200,
+# or of the whole path if the name has none: outputs-200/test.csv -> 200
+DEFAULT_CCU_PATTERN = r"(\d+)(?!.*\d)"
+
+
+def parse_ccu(file, pattern=None):
+    """The CCU of a summary file, `pattern` is searched in its whole path."""
+    if pattern is None:
+        pattern = DEFAULT_CCU_PATTERN
+        texts = [path.basename(file), file]
+    else:
+        texts = [file]
+    for text in texts:
+        match = re.search(pattern, text)
+        if match is not None:
+            return int(match.group(1))
+    raise RuntimeError(f"Cannot find the CCU in {file} with {pattern!r}")
+
+
+def load_summaries(files, pattern=None):
+    frames = []
+    for file in files:
+        df = pd.read_csv(file, dtype={"transaction": str})
+        missing = {"transaction", "throughput", "pct2ResTime"} - set(df.columns)
+        if len(missing) > 0:
+            raise RuntimeError(f"{file} is not a run summary, "
+                               f"missing {', '.join(sorted(missing))}")
+        df["ccu"] = parse_ccu(file, pattern)
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values(by=["transaction", "ccu"])
+
+
+def find_knee(ccus, throughputs, latencies,
+              min_efficiency=0.5, max_latency_growth=0.2):
+    """The last CCU before throughput stops scaling, or None.
+
+    Going from one level to the next, the scaling efficiency is the
+    relative throughput gain over the relative CCU gain: 1 when the
+    throughput scales linearly, negative when it drops. The knee is the
+    first level after which the efficiency is under `min_efficiency`
+    while the p95 grows by more than `max_latency_growth`.
+    """
+    levels = list(zip(ccus, throughputs, latencies))
+    for (ccu, tput, lat), (next_ccu, next_tput, next_lat) in zip(
+            levels, levels[1:]):
+        if ccu <= 0 or tput <= 0 or next_ccu <= ccu:
+            continue
+        efficiency = (next_tput / tput - 1) / (next_ccu / ccu - 1)
+        if efficiency < min_efficiency and \
+                next_lat > lat * (1 + max_latency_growth):
+            return ccu
+    return None
+
+
+def scaling_table(df, min_efficiency=0.5, max_latency_growth=0.2):
+    rows = []
+    for transaction, group in df.groupby("transaction", sort=False):
+        knee = find_knee(group["ccu"].tolist(),
+                         group["throughput"].tolist(),
+                         group["pct2ResTime"].tolist(),
+                         min_efficiency, max_latency_growth)
+        for _, row in group.iterrows():
+            rows.append(dict(
+                transaction=transaction,
+                ccu=row["ccu"],
+                throughput=row["throughput"],
+                meanResTime=row["meanResTime"],
+                pct2ResTime=row["pct2ResTime"],
+                errorPct=row["errorPct"],
+                knee=knee,
+            ))
+    return pd.DataFrame(rows)
+
+
+#
+# HTML report, charts are inline SVG
+#
+def _scale(values, lo, hi):
+    vmin, vmax = min(values), max(values)
+    if vmax == vmin:
+        return [(lo + hi) / 2 for _ in values]
+    return [lo + (v - vmin) / (vmax - vmin) * (hi - lo) for v in values]
+
+
+def svg_chart(ccus, throughputs, latencies, knee=None,
+              width=520, height=240, margin=50):
+    xs = _scale(ccus, margin, width - margin)
+    tput_ys = _scale([0] + throughputs, height - margin, margin)[1:]
+    lat_ys = _scale([0] + latencies, height - margin, margin)[1:]
+
+    def polyline(ys, color):
+        points = " ".join(f"{x:.1f},{y:.1f}" for x, y in zip(xs, ys))
+        dots = "".join(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="3" '
+                       f'fill="{color}"/>' for x, y in zip(xs, ys))
+        return (f'<polyline points="{points}" fill="none" '
+                f'stroke="{color}" stroke-width="2"/>{dots}')
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+        f'height="{height}" font-size="11" font-family="sans-serif">',
+        f'<line x1="{margin}" y1="{height - margin}" x2="{width - margin}" '
+        f'y2="{height - margin}" stroke="#888"/>',
+        f'<line x1="{margin}" y1="{margin}" x2="{margin}" '
+        f'y2="{height - margin}" stroke="#888"/>',
+        f'<line x1="{width - margin}" y1="{margin}" x2="{width - margin}" '
+        f'y2="{height - margin}" stroke="#888"/>',
+        f'<text x="{margin}" y="{margin - 10}" fill="#1f77b4" '
+        f'text-anchor="middle">{max(throughputs):.1f}/s</text>',
+        f'<text x="{width - margin}" y="{margin - 10}" fill="#d62728" '
+        f'text-anchor="middle">{max(latencies):.0f}ms</text>',
+    ]
+    for x, ccu in zip(xs, ccus):
+        parts.append(f'<text x="{x:.1f}" y="{height - margin + 15}" '
+                     f'text-anchor="middle">{ccu}</text>')
+    if knee is not None:
+        x = xs[ccus.index(knee)]
+        parts.append(f'<line x1="{x:.1f}" y1="{margin}" x2="{x:.1f}" '
+                     f'y2="{height - margin}" stroke="#2ca02c" '
+                     f'stroke-dasharray="4 3"/>')
+        parts.append(f'<text x="{x:.1f}" y="{margin - 10}" fill="#2ca02c" '
+                     f'text-anchor="middle">knee {knee}</text>')
+    parts.append(polyline(tput_ys, "#1f77b4"))
+    parts.append(polyline(lat_ys, "#d62728"))
+    parts.append(f'<text x="{width / 2}" y="{height - 10}" '
+                 f'text-anchor="middle">CCU</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def render_html(table, title="Scaling report"):
+    sections = []
+    for transaction, group in table.groupby("transaction", sort=False):
+        knee = group["knee"].iloc[0]
+        knee = None if pd.isna(knee) else int(knee)
+        chart = svg_chart(group["ccu"].tolist(),
+                          group["throughput"].tolist(),
+                          group["pct2ResTime"].tolist(),
+                          knee)
+        rows = "".join(
+            f"<tr><td>{row.ccu}</td><td>{row.throughput:.2f}</td>"
+            f"<td>{row.meanResTime:.0f}</td><td>{row.pct2ResTime:.0f}</td>"
+            f"<td>{row.errorPct:.2f}</td></tr>"
+            for row in group.itertuples())
+        knee_text = "no knee found" if knee is None else f"knee at CCU {knee}"
+        sections.append(
+            f"<h2>{html.escape(transaction)}</h2>"
+            f"<p>{knee_text}</p>{chart}"
+            "<table><tr><th>CCU</th><th>Throughput (/s)</th>"
+            "<th>Mean (ms)</th><th>p95 (ms)</th><th>Error %</th></tr>"
+            f"{rows}</table>")
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+        f"<title>{html.escape(title)}</title><style>"
+        "body{font-family:sans-serif;margin:2em}"
+        "table{border-collapse:collapse;margin:1em 0 2em}"
+        "td,th{border:1px solid #ccc;padding:2px 8px;text-align:right}"
+        "</style></head><body>"
+        f"<h1>{html.escape(title)}</h1>"
+        "<p><span style=\"color:#1f77b4\">throughput</span>, "
+        "<span style=\"color:#d62728\">p95</span></p>"
+        + "".join(sections) + "</body></html>")
+
+
+def main_scaling(args):
+    df = load_summaries(args.inputs, args.ccu_pattern)
+    table = scaling_table(df, args.min_efficiency, args.max_latency_growth)
+
+    utils.prepare_write(args.output)
+    with open(args.output, "w", encoding="utf-8") as fp:
+        fp.write(render_html(table))
+    logging.info(f"Output written to {args.output}")
+    if args.csv is not None:
+        table.to_csv(args.csv, index=False)
+        logging.info(f"Output written to {args.csv}")
+
+    for transaction, group in table.groupby("transaction", sort=False):
+        knee = group["knee"].iloc[0]
+        if not pd.isna(knee):
+            print(f"{transaction}: throughput stops scaling after "
+                  f"CCU {int(knee)}")
+
+
+def main(args):
+    if args.report == "scaling":
+        main_scaling(args)
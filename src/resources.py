@@ -0,0 +1,198 @@
+import csv
+import logging
+import shutil
+import time
+from os import cpu_count, listdir, path, sysconf
+from subprocess import run, PIPE, DEVNULL, TimeoutExpired
+from threading import Thread, Event
+
+import numpy as np
+
+CLOCK_TICKS = sysconf("SC_CLK_TCK")
+PAGE_SIZE = sysconf("SC_PAGE_SIZE")
+
+COLUMNS = ["time", "cpu_pct", "host_cpu_pct", "rss_mb", "threads",
+           "load1", "heap_used_mb", "old_used_mb", "gc_count", "gc_time_s"]
+
+
+def get_resources_file(output_file):
+    return path.splitext(output_file)[0] + ".resources.csv"
+
+
+def read_proc_stat(pid):
+    # The command name can contain spaces and parentheses
+    with open(f"/proc/{pid}/stat") as fp:
+        data = fp.read()
+    comm = data[data.index("(") + 1:data.rindex(")")]
+    fields = data[data.rindex(")") + 2:].split()
+    return dict(
+        comm=comm,
+        ppid=int(fields[1]),
+        ticks=int(fields[11]) + int(fields[12]),
+        threads=int(fields[17]),
+        rss=int(fields[21]) * PAGE_SIZE,
+    )
+
+
+def process_tree(root_pid):
+    """/proc/<pid>/stat of a process and all its descendants."""
+    stats = {}
+    for name in listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            stats[int(name)] = read_proc_stat(name)
+        except (OSError, ValueError, IndexError):
+            # Exited in the meantime
+            continue
+    children = {}
+    for pid, stat in stats.items():
+        children.setdefault(stat["ppid"], []).append(pid)
+
+    tree = {}
+    stack = [root_pid]
+    while len(stack) > 0:
+        pid = stack.pop()
+        if pid in stats:
+            tree[pid] = stats[pid]
+            stack.extend(children.get(pid, []))
+    return tree
+
+
+def host_cpu_ticks():
+    # busy and total ticks of all CPUs
+    with open("/proc/stat") as fp:
+        values = [int(v) for v in fp.readline().split()[1:]]
+    idle = values[3] + values[4]
+    total = sum(values[:8])
+    return total - idle, total
+
+
+def load_average():
+    with open("/proc/loadavg") as fp:
+        return float(fp.read().split()[0])
+
+
+def jstat_gc(pid):
+    """Heap and old generation used (MB), GC count and GC time of a JVM.
+
+    None without jstat, or if it did not answer in time.
+    """
+    jstat = shutil.which("jstat")
+    if jstat is None:
+        return None
+    try:
+        proc = run([jstat, "-gc", str(pid)], stdout=PIPE, stderr=DEVNULL,
+                   text=True, timeout=10)
+    except TimeoutExpired:
+        logging.warning(f"jstat did not answer for {pid}, skipping a sample")
+        return None
+    lines = proc.stdout.split("\n")
+    if proc.returncode != 0 or len(lines) < 2:
+        return None
+    row = dict(zip(lines[0].split(), lines[1].split()))
+    used = sum(float(row.get(k, 0)) for k in ("S0U", "S1U", "EU", "OU"))
+    return dict(
+        heap_used_mb=used / 1024,
+        old_used_mb=float(row.get("OU", 0)) / 1024,
+        gc_count=int(row.get("YGC", 0)) + int(row.get("FGC", 0)),
+        gc_time_s=float(row.get("GCT", 0)),
+    )
+
+
+class ResourceMonitor(Thread):
+    """Sample the resources of Jmeter's process tree every `interval` seconds.
+
+    CPU is the share of all the CPUs of the host used by the tree, RSS and
+    threads are summed over the tree. Heap and GC activity of the JVM come
+    from `jstat` when it is installed. Samples are written to
+    `output_file` as they are taken.
+    """
+
+    def __init__(self, pid, interval, output_file):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.output_file = output_file
+        self.samples = []
+        self.stopped = Event()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def sample(self, previous):
+        tree = process_tree(self.pid)
+        ticks = sum(stat["ticks"] for stat in tree.values())
+        host_busy, host_total = host_cpu_ticks()
+        now = time.monotonic()
+        row = dict(
+            time=time.time(),
+            rss_mb=sum(stat["rss"] for stat in tree.values()) / 2**20,
+            threads=sum(stat["threads"] for stat in tree.values()),
+            load1=load_average(),
+        )
+        if previous is not None:
+            elapsed = max(now - previous["now"], 1e-3)
+            cpus = cpu_count() or 1
+            row["cpu_pct"] = max(ticks - previous["ticks"], 0) / \
+                CLOCK_TICKS / elapsed / cpus * 100
+            row["host_cpu_pct"] = (host_busy - previous["host_busy"]) / \
+                max(host_total - previous["host_total"], 1) * 100
+
+        java = [pid for pid, stat in tree.items() if stat["comm"] == "java"]
+        if len(java) > 0:
+            row.update(jstat_gc(java[0]) or {})
+        state = dict(now=now, ticks=ticks,
+                     host_busy=host_busy, host_total=host_total)
+        return row, state
+
+    def run(self):
+        with open(self.output_file, "w", newline="") as fp:
+            writer = csv.DictWriter(fp, fieldnames=COLUMNS)
+            writer.writeheader()
+            state = None
+            while True:
+                try:
+                    row, state = self.sample(state)
+                except Exception:
+                    logging.exception("Resource sampling failed")
+                    return
+                if "cpu_pct" in row:
+                    self.samples.append(row)
+                    writer.writerow(row)
+                    fp.flush()
+                if self.stopped.wait(self.interval):
+                    return
+
+    def saturation(self, heap_gb=None, max_cpu_pct=90, max_heap_pct=90,
+                   max_gc_pct=10):
+        """Generator columns for the summary.
+
+        The generator is saturated when the CPU or the heap is above the
+        limit for more than 10% of the samples (their 90th percentile),
+        or when GC takes more than `max_gc_pct` of the time.
+        The heap is the old generation after a collection: eden fills up
+        to the max heap between collections, the live set is what stays.
+        """
+        if len(self.samples) == 0:
+            return {}
+        cpu = np.percentile([s["cpu_pct"] for s in self.samples], 90)
+        result = dict(generatorCpuPct=float(cpu),
+                      generatorSaturated=bool(cpu > max_cpu_pct))
+
+        gc = [s for s in self.samples if "gc_count" in s]
+        after_gc = [s["old_used_mb"] for previous, s in zip(gc, gc[1:])
+                    if s["gc_count"] > previous["gc_count"]]
+        if len(after_gc) > 0:
+            # Jmeter's default heap is 1GB
+            heap_pct = np.percentile(after_gc, 90) / \
+                ((heap_gb or 1) * 1024) * 100
+            result["generatorHeapPct"] = float(heap_pct)
+            result["generatorSaturated"] |= bool(heap_pct > max_heap_pct)
+        if len(gc) > 1 and gc[-1]["time"] > gc[0]["time"]:
+            gc_pct = (gc[-1]["gc_time_s"] - gc[0]["gc_time_s"]) / \
+                (gc[-1]["time"] - gc[0]["time"]) * 100
+            result["generatorGcPct"] = float(gc_pct)
+            result["generatorSaturated"] |= bool(gc_pct > max_gc_pct)
+        return result
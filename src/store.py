@@ -0,0 +1,317 @@
+import logging
+import sqlite3
+import time
+from os import path, makedirs, remove, replace
+from shutil import rmtree
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+
+from . import utils
+from .jtl import read_jtl
+from .jmx_document import JmxDocument
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    test TEXT,
+    jmx_hash TEXT,
+    ccu INTEGER,
+    duration INTEGER,
+    domain TEXT,
+    jtl TEXT,
+    started INTEGER,
+    ended INTEGER,
+    samples INTEGER,
+    ingested REAL
+);
+CREATE TABLE IF NOT EXISTS labels (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    code INTEGER,
+    label TEXT,
+    offset INTEGER,
+    count INTEGER,
+    errors INTEGER,
+    elapsed_sum INTEGER,
+    PRIMARY KEY (run_id, code)
+);
+CREATE INDEX IF NOT EXISTS labels_by_label ON labels(label, run_id);
+CREATE INDEX IF NOT EXISTS runs_by_test ON runs(test, ccu);
+"""
+
+# Column name -> dtype of the sample files
+COLUMNS = {
+    "elapsed": np.int32,
+    "timeStamp": np.int64,
+    "success": np.bool_,
+    "bytes": np.int32,
+    "sentBytes": np.int32,
+}
+
+
+def _int(text):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _add(total, values):
+    # Per label totals, `values` may have new labels at the end
+    if len(values) > len(total):
+        total = np.pad(total, (0, len(values) - len(total)))
+    total[:len(values)] += values.astype(total.dtype)
+    return total
+
+
+def jmx_tags(jmx_file):
+    """Replace parameters of a JMX file: CCU, duration and domain."""
+    doc = JmxDocument.load(jmx_file)
+
+    def first(name):
+        for prop in doc.props(name):
+            if prop.text:
+                return prop.text
+        return None
+
+    return dict(
+        jmx_hash=utils.file_hash(jmx_file),
+        ccu=_int(first("ThreadGroup.num_threads")),
+        duration=_int(first("ThreadGroup.duration")),
+        domain=first("HTTPSampler.domain"),
+    )
+
+
+class Store:
+    """SQLite index of ingested .jtl files and their samples, in columns.
+
+    Each run is stored in `runs/<id>/` as one .npy file per column
+    (see `COLUMNS`), sorted by label then response time. The labels
+    table is the dictionary of a run: the samples of a label are the
+    rows `offset` to `offset + count`, so a percentile of a label is a
+    single read of the memory mapped `elapsed` column.
+
+        store = Store("results/")
+        store.ingest("test.jtl", jmx_file="test.jmx")
+        store.query(label="/items", ccu=200, last=20)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        makedirs(path.join(directory, "runs"), exist_ok=True)
+        self.db = sqlite3.connect(path.join(directory, "index.sqlite"),
+                                  timeout=60, check_same_thread=False)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def run_dir(self, run_id):
+        return path.join(self.directory, "runs", str(run_id))
+
+    #
+    # Ingest
+    #
+    def ingest(self, jtl_file, jmx_file=None, test=None, chunksize=500_000,
+               **tags):
+        """Copy the samples of a .jtl file into the store, return the run id.
+
+        `tags` (ccu, duration, domain, jmx_hash) override the ones read
+        from `jmx_file`. The log is read `chunksize` rows at a time, only
+        the samples of one chunk or of one label are in memory at once.
+        """
+        if jmx_file is not None:
+            tags = {**jmx_tags(jmx_file), **tags}
+        if test is None:
+            test = path.splitext(path.basename(jmx_file or jtl_file))[0]
+
+        #
+        # Columns are written to a temporary folder first, so that the
+        # database is only locked while the run is registered
+        #
+        tmp_dir = path.join(self.directory, "runs", f".tmp-{uuid4().hex}")
+        makedirs(tmp_dir)
+        try:
+            part_file = lambda part, name: \
+                path.join(tmp_dir, f"part-{part}.{name}.npy")
+
+            #
+            # Write each chunk to its own part files, labels are dictionary
+            # encoded per chunk. Only the totals of the labels are kept
+            #
+            codes = {}
+            counts, errors, sums = (np.zeros(0, dtype=np.int64)
+                                    for _ in range(3))
+            started, ended = None, None
+            parts = 0
+            for chunk in read_jtl(jtl_file, chunksize):
+                if len(chunk) == 0:
+                    continue
+                labels = pd.Categorical(chunk["label"])
+                mapping = np.array([codes.setdefault(label, len(codes))
+                                    for label in labels.categories],
+                                   dtype=np.int32)
+                label_codes = mapping[labels.codes]
+                columns = {name: chunk[name].to_numpy(dtype=dtype)
+                           for name, dtype in COLUMNS.items()}
+                np.save(part_file(parts, "label"), label_codes)
+                for name, values in columns.items():
+                    np.save(part_file(parts, name), values)
+                parts += 1
+
+                counts = _add(counts, np.bincount(
+                    label_codes, minlength=len(codes)))
+                errors = _add(errors, np.bincount(
+                    label_codes, weights=~columns["success"],
+                    minlength=len(codes)))
+                sums = _add(sums, np.bincount(
+                    label_codes, weights=columns["elapsed"],
+                    minlength=len(codes)))
+                first = int(columns["timeStamp"].min())
+                last = int((columns["timeStamp"] + columns["elapsed"]).max())
+                started = first if started is None else min(started, first)
+                ended = last if ended is None else max(ended, last)
+            if parts == 0:
+                raise RuntimeError(f"{jtl_file} has no samples")
+            samples = int(counts.sum())
+            offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+            #
+            # Scatter the parts to the label's rows of the memory mapped
+            # columns, keeping the order of the log
+            #
+            columns = {
+                name: np.lib.format.open_memmap(
+                    path.join(tmp_dir, f"{name}.npy"), mode="w+",
+                    dtype=dtype, shape=(samples,))
+                for name, dtype in COLUMNS.items()}
+            cursors = offsets.copy()
+            for part in range(parts):
+                label_codes = np.load(part_file(part, "label"))
+                order = np.argsort(label_codes, kind="stable")
+                label_codes = label_codes[order]
+                part_counts = np.bincount(label_codes, minlength=len(codes))
+                part_offsets = np.cumsum(part_counts) - part_counts
+                rows = cursors[label_codes] + np.arange(len(label_codes)) \
+                    - part_offsets[label_codes]
+                for name, values in columns.items():
+                    values[rows] = np.load(part_file(part, name))[order]
+                cursors += part_counts
+                for name in ["label", *COLUMNS]:
+                    remove(part_file(part, name))
+
+            #
+            # Then sort the rows of each label by response time
+            #
+            for offset, count in zip(offsets, counts):
+                rows = slice(offset, offset + count)
+                order = np.argsort(columns["elapsed"][rows], kind="stable")
+                for values in columns.values():
+                    values[rows] = values[rows][order]
+            for values in columns.values():
+                values.flush()
+            del columns
+
+            with self.db:
+                cursor = self.db.execute(
+                    "INSERT INTO runs (test, jmx_hash, ccu, duration, domain, "
+                    "jtl, started, ended, samples, ingested) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (test, tags.get("jmx_hash"), tags.get("ccu"),
+                     tags.get("duration"), tags.get("domain"),
+                     path.abspath(jtl_file), started, ended, samples,
+                     time.time()))
+                run_id = cursor.lastrowid
+                self.db.executemany(
+                    "INSERT INTO labels VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, code, label, int(offsets[code]),
+                      int(counts[code]), int(errors[code]), int(sums[code]))
+                     for label, code in codes.items()])
+                replace(tmp_dir, self.run_dir(run_id))
+        finally:
+            rmtree(tmp_dir, ignore_errors=True)
+        logging.info(f"Ingested {jtl_file} as run {run_id} "
+                     f"({samples} samples)")
+        return run_id
+
+    #
+    # Queries
+    #
+    def runs(self, test=None, ccu=None, label=None, last=None):
+        query = "SELECT * FROM runs WHERE 1 = 1"
+        params = []
+        if label is not None:
+            query += (" AND EXISTS (SELECT 1 FROM labels "
+                      "WHERE run_id = runs.id AND label = ?)")
+            params.append(label)
+        if test is not None:
+            query += " AND test = ?"
+            params.append(test)
+        if ccu is not None:
+            query += " AND ccu = ?"
+            params.append(ccu)
+        query += " ORDER BY id DESC"
+        if last is not None:
+            query += " LIMIT ?"
+            params.append(last)
+        return pd.read_sql_query(query, self.db, params=params)
+
+    def column(self, run_id, name):
+        return np.load(path.join(self.run_dir(run_id), f"{name}.npy"),
+                       mmap_mode="r")
+
+    def query(self, label=None, test=None, ccu=None, last=None,
+              percentiles=(50, 90, 95, 99)):
+        """Statistics of a label (all labels if None) in the matching runs.
+
+        Percentiles use Jmeter's estimator, like `jtl.aggregate_jtl`.
+        """
+        runs = self.runs(test=test, ccu=ccu, label=label, last=last)
+        query = (
+            "SELECT run_id, label, offset, count, errors, elapsed_sum "
+            "FROM labels WHERE run_id IN (%s)" % ",".join("?" * len(runs)))
+        params = runs["id"].tolist()
+        if label is not None:
+            query += " AND label = ?"
+            params.append(label)
+        labels = self.db.execute(query, params).fetchall()
+
+        by_id = runs.set_index("id")
+        rows = []
+        for run_id, label_, offset, count, errors, elapsed_sum in labels:
+            if count == 0:
+                continue
+            run = by_id.loc[run_id]
+            elapsed = self.column(run_id, "elapsed")[offset:offset + count]
+            values = np.percentile(elapsed, percentiles, method="weibull")
+            row = dict(run_id=run_id, test=run["test"], ccu=run["ccu"],
+                       duration=run["duration"], domain=run["domain"],
+                       label=label_, sampleCount=count, errorCount=errors,
+                       errorPct=errors / count * 100,
+                       meanResTime=elapsed_sum / count,
+                       minResTime=int(elapsed[0]),
+                       maxResTime=int(elapsed[-1]))
+            for p, value in zip(percentiles, values):
+                row[f"p{p:g}"] = float(value)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def main(args):
+    store = Store(args.store)
+    try:
+        if args.store_action == "ingest":
+            for jtl_file in args.inputs:
+                store.ingest(jtl_file, jmx_file=args.jmx, test=args.test)
+        elif args.store_action == "query":
+            df = store.query(label=args.label, test=args.test,
+                             ccu=args.ccu, last=args.last)
+            if args.output is not None:
+                df.to_csv(args.output, index=False)
+                logging.info(f"Output written to {args.output}")
+            else:
+                print(df.to_string(index=False))
+    finally:
+        store.close()
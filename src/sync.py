@@ -1,14 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
-from os import path, walk, curdir, makedirs
-from fastapi import FastAPI
+from os import path, walk, curdir, replace, remove, stat
+from threading import Lock, local
+from urllib.parse import quote
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from argparse import ArgumentParser
 import requests
+import json
+import re
 import uvicorn
+import zlib
 
-port = 30940  # totally random
+from . import utils
+
+port = 30940  # totally random, default of --port
 endpoint = "/sync"
 
+# Files are read, compressed and written by chunks of this size
+CHUNK_SIZE = 1 << 20
+
 
 def find_jmx(d):
     results = []
@@ -19,6 +31,63 @@ def find_jmx(d):
     return results
 
 
+class HashCache:
+    """sha256 of files, cached by path, size and modification time."""
+
+    def __init__(self):
+        self.file = path.join(utils.cache_dir("sync"), "hashes.json")
+        self.lock = Lock()
+        self.entries = {}
+        self.changed = False
+        if path.isfile(self.file):
+            try:
+                with open(self.file, encoding="utf-8") as fp:
+                    self.entries = json.load(fp)
+            except ValueError:
+                pass
+
+    def hash(self, file):
+        st = stat(file)
+        key = path.abspath(file)
+        entry = self.entries.get(key)
+        if entry is not None and entry["size"] == st.st_size \
+                and entry["mtime_ns"] == st.st_mtime_ns:
+            return entry["sha256"]
+        sha256 = utils.file_hash(file)
+        with self.lock:
+            self.entries[key] = dict(size=st.st_size, mtime_ns=st.st_mtime_ns,
+                                     sha256=sha256)
+            self.changed = True
+        return sha256
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            self.changed = False
+            tmp_file = f"{self.file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as fp:
+                json.dump(self.entries, fp)
+            replace(tmp_file, self.file)
+
+
+def file_chunks(file, offset=0):
+    with open(file, "rb") as fp:
+        fp.seek(offset)
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            yield chunk
+
+
+def gzip_chunks(file):
+    # Fast compression level, .jtl and .csv files compress well anyway
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in file_chunks(file):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 def main_push(args):
     inputs = args.inputs
 
@@ -37,14 +106,34 @@ def main_push(args):
             else:
                 raise RuntimeError(f"{file} does not exists")
 
+    input_files = [path.relpath(file, curdir) for file in input_files]
+    uvicorn.run(make_app(input_files), host="0.0.0.0", port=args.port)
+
+
+def make_app(input_files, root=curdir):
+    """The push server, publishing `input_files`, relative to `root`."""
     #
-    # Create request body
+    # The manifest is made again for each listing, files edited since
+    # the push started are published with their new size and hash.
+    # Only modified files are hashed again, see `HashCache`.
+    # Files are streamed from the disk when they are requested
     #
-    input_files = [path.relpath(file, curdir) for file in input_files]
-    body = {}
-    for file in input_files:
-        with open(file, encoding='utf-8') as fp:
-            body[file] = fp.read()
+    published = set(input_files)
+    hashes = HashCache()
+
+    def manifest():
+        files = []
+        for file in input_files:
+            full_path = path.join(root, file)
+            if not path.isfile(full_path):
+                continue
+            files.append(dict(path=file, size=path.getsize(full_path),
+                              sha256=hashes.hash(full_path)))
+        hashes.save()
+        return files
+
+    # Hash the files before the first pull
+    manifest()
 
     app = FastAPI()
     app.add_middleware(
@@ -57,24 +146,128 @@ def main_push(args):
 
     @app.get(endpoint)
     def get_endpoint():
-        return body
+        return dict(files=manifest())
+
+    @app.get(endpoint + "/files/{file:path}")
+    def get_file(file: str, request: Request):
+        full_path = path.join(root, file)
+        if file not in published or not path.isfile(full_path):
+            raise HTTPException(status_code=404, detail=f"{file} not found")
+        size = path.getsize(full_path)
+
+        #
+        # Resume, ranges are sent as is
+        #
+        match = re.fullmatch(r"bytes=(\d+)-", request.headers.get("range", ""))
+        if match is not None:
+            offset = int(match.group(1))
+            if offset >= size:
+                raise HTTPException(status_code=416)
+            return StreamingResponse(
+                file_chunks(full_path, offset),
+                status_code=206,
+                media_type="application/octet-stream",
+                headers={"Content-Length": str(size - offset),
+                         "Content-Range": f"bytes {offset}-{size - 1}/{size}"})
+
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            return StreamingResponse(gzip_chunks(full_path),
+                                     media_type="application/octet-stream",
+                                     headers={"Content-Encoding": "gzip"})
+        return StreamingResponse(file_chunks(full_path),
+                                 media_type="application/octet-stream",
+                                 headers={"Content-Length": str(size)})
+
+    return app
+
+
+def pull_file(session, url, entry):
+    """Download a file to `<file>.part`, then rename it once verified.
+
+    An existing `.part` file is resumed with a range request.
+    """
+    file = entry["path"]
+    part_file = f"{file}.part"
+    utils.prepare_write(file)
 
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    offset = path.getsize(part_file) if path.isfile(part_file) else 0
+    if offset >= entry["size"]:
+        offset = 0
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+    with session.get(f"{url}/files/{quote(file)}", headers=headers,
+                     stream=True) as res:
+        if res.status_code not in (200, 206):
+            raise RuntimeError(f"Cannot pull {file}: HTTP {res.status_code}")
+        # The server may ignore the range and send the whole file
+        if res.status_code == 200:
+            offset = 0
+        mode = "ab" if offset > 0 else "wb"
+        with open(part_file, mode) as f:
+            for chunk in res.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+
+    if utils.file_hash(part_file) != entry["sha256"]:
+        remove(part_file)
+        if offset > 0:
+            # Stale part of an older version of the file
+            return pull_file(session, url, entry)
+        raise RuntimeError(f"{file} does not match the pushed file, "
+                           "was it modified during the transfer?")
+    replace(part_file, file)
+    return offset
 
 
 def main_pull(args):
     host = args.host
+    url = f"http://{host}:{args.port}{endpoint}"
+
+    # One pooled session per download thread
+    sessions = local()
 
-    res = requests.get(f"http://{host}:{port}{endpoint}")
+    def session():
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        return sessions.session
+
+    res = session().get(url)
     if res.status_code != 200:
         raise RuntimeError(f"Cannot pull from {host}")
 
-    body = res.json()
-    for file, content in body.items():
-        dirname = path.dirname(file)
-        if dirname != '':
-            makedirs(dirname, exist_ok=True)
+    #
+    # Only fetch the missing and changed files
+    #
+    hashes = HashCache()
+    entries = []
+    for entry in res.json()["files"]:
+        file = entry["path"]
+        if path.isabs(file) or path.normpath(file).startswith(".."):
+            raise RuntimeError(f"Refusing to write {file} outside "
+                               "of the current folder")
+        if path.isfile(file) and path.getsize(file) == entry["size"] \
+                and hashes.hash(file) == entry["sha256"]:
+            continue
+        entries.append(entry)
+
+    def pull(entry):
+        offset = pull_file(session(), url, entry)
+        resumed = f" (resumed at {offset} bytes)" if offset > 0 else ""
+        print(f'[OK] {entry["path"]}{resumed}')
+
+    jobs = args.jobs or 4
+    errors = []
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = [(entry, executor.submit(pull, entry)) for entry in entries]
+        for entry, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f'[FAILED] {entry["path"]}: {e}')
+                errors.append(entry["path"])
+    hashes.save()
 
-        with open(file, 'w', encoding='utf-8') as f:
-            f.write(content)
-        print(f'[OK] {file}')
+    total = len(res.json()["files"])
+    print(f"{total - len(entries)} files up to date, "
+          f"{len(entries) - len(errors)} pulled")
+    if len(errors) > 0:
+        raise RuntimeError(f"{len(errors)} files failed, run pull again "
+                           "to resume them")
@@ -1,5 +1,10 @@
-from os import path, walk, makedirs, curdir
+from os import path, walk, makedirs, curdir, cpu_count, environ
+from concurrent.futures import ProcessPoolExecutor
 from functools import wraps
+from importlib.metadata import version, PackageNotFoundError
+import traceback
+import hashlib
+import logging
 import re
 
 
@@ -45,7 +50,7 @@ def mux_input_output(input_file, output_file):
         if path.isdir(output_file):
             bn = path.basename(input_file)
             return [(input_file, path.join(output_file, bn))]
-        elif path.isfile(output_file):
+        elif path.isfile(output_file) or not path.exists(output_file):
             return [(input_file, output_file)]
         else:
             raise unsupported_case
@@ -71,24 +76,140 @@ def mux_input_output(input_file, output_file):
             return list(zip(input_files, output_files))
 
 
+class _RecordCollector(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        #
+        # Make the record picklable
+        #
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
+def _run_one(main_fn, args, input_file, output_file, level=None):
+    #
+    # Run one input/output pair, capture the logs
+    # so that they can be replayed in order by the parent process
+    #
+    root = logging.getLogger()
+    collector = _RecordCollector()
+    handlers, root.handlers = root.handlers, [collector]
+    if level is not None:
+        root.setLevel(level)
+    result = None
+    try:
+        result = main_fn.__wrapped__(args, input_file, output_file)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        root.handlers = handlers
+    return collector.records, result, error
+
+
 def with_mux(main_fn):
+    #
+    # `on_result(input_file, output_file, result)` is called in input order
+    # with the return value of `main_fn` for every pair that succeeded.
+    # With one job the first error is raised as is, in a process pool the
+    # errors of every pair are logged and reported together
+    #
     @wraps(main_fn)
-    def main(args):
+    def main(args, on_result=None):
         inputs = mux_input_output(args.input, args.output)
-        for input_file, output_file in inputs:
-            main_fn(args, input_file, output_file)
+        jobs = getattr(args, "jobs", None) or cpu_count() or 1
+        jobs = min(jobs, len(inputs))
+
+        #
+        # One at a time, log directly and stop at the first error
+        #
+        if jobs <= 1:
+            for input_file, output_file in inputs:
+                result = main_fn(args, input_file, output_file)
+                if on_result is not None:
+                    on_result(input_file, output_file, result)
+            return
+
+        #
+        # In a process pool, results are collected in the input order
+        #
+        level = logging.getLogger().level
+        with ProcessPoolExecutor(jobs) as executor:
+            futures = [
+                executor.submit(_run_one, main, args,
+                                input_file, output_file, level)
+                for input_file, output_file in inputs
+            ]
+            results = [future.result() for future in futures]
+
+        #
+        # Replay the logs, report the errors at the end.
+        # Like `logging.info` would, set up a handler if there is none
+        #
+        if len(logging.getLogger().handlers) == 0:
+            logging.basicConfig()
+        errors = []
+        for (input_file, output_file), (records, result, error) in zip(
+                inputs, results):
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            if error is not None:
+                errors.append((input_file, error))
+            elif on_result is not None:
+                on_result(input_file, output_file, result)
+        for input_file, error in errors:
+            logging.error(f"Failed to process {input_file}\n{error}")
+        if len(errors) > 0:
+            raise RuntimeError(
+                f"{len(errors)} of {len(inputs)} files failed, see the log above")
 
     return main
 
 
+def cache_dir(name):
+    root = environ.get("XDG_CACHE_HOME") or path.join(
+        path.expanduser("~"), ".cache")
+    d = path.join(root, "jmx-tools", name)
+    makedirs(d, exist_ok=True)
+    return d
+
+
+def file_hash(file):
+    sha = hashlib.sha256()
+    with open(file, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def tool_version():
+    try:
+        return version("jmx-tools")
+    except PackageNotFoundError:
+        return "unknown"
+
+
 def postman_walk(items, callback):
     is_request = lambda item: "request" in item
     is_collection = lambda item: "item" in item
-    for item in items:
-        if is_request(item):
+    done = object()
+    stack = [iter(items)]
+    while len(stack) > 0:
+        item = next(stack[-1], done)
+        if item is done:
+            stack.pop()
+        elif is_request(item):
             callback(item)
         elif is_collection(item):
-            postman_walk(item, callback)
+            stack.append(iter(item["item"]))
 
 
 def postman_all_items(postman_config):
@@ -97,3 +218,21 @@ def postman_all_items(postman_config):
         items.append(item)
     postman_walk(postman_config['item'], callback)
     return items
+
+
+def postman_host(url):
+    # Postman 2.1 allows the host as a string or a list of labels
+    host = url.get("host", [])
+    if isinstance(host, str):
+        return host
+    return ".".join(host)
+
+
+def postman_path(url):
+    # The path is a string or a list of segments, segments are strings
+    # or {"type": "string", "value": ...} objects
+    segments = url.get("path", [])
+    if isinstance(segments, str):
+        return [segment for segment in segments.split("/") if segment]
+    return [segment if isinstance(segment, str) else segment.get("value", "")
+            for segment in segments]
@@ -0,0 +1,36 @@
+import sys
+import types
+from os import path
+
+#
+# The sources are installed as `jmx_tools` (see pyproject.toml),
+# make them importable without installing the package
+#
+SRC = path.join(path.dirname(path.dirname(path.abspath(__file__))), "src")
+if "jmx_tools" not in sys.modules:
+    package = types.ModuleType("jmx_tools")
+    package.__path__ = [SRC]
+    sys.modules["jmx_tools"] = package
+
+FIXTURES = path.join(path.dirname(path.abspath(__file__)), "fixtures")
+
+
+def cli_command(*argv):
+    """Command line of `jmx-tools *argv` from the sources."""
+    boot = ("import sys, types; "
+            "package = types.ModuleType('jmx_tools'); "
+            f"package.__path__ = [{SRC!r}]; "
+            "sys.modules['jmx_tools'] = package; "
+            "from jmx_tools.__main__ import main; "
+            "main(sys.argv[1:])")
+    return [sys.executable, "-c", boot, *map(str, argv)]
+
+
+def run_cli(*argv, env=None, cwd=None):
+    """Run `jmx-tools *argv` in a new process, return the CompletedProcess."""
+    import subprocess
+    from os import environ
+
+    return subprocess.run(cli_command(*argv),
+                          env={**environ, **(env or {})}, cwd=cwd,
+                          capture_output=True, text=True, timeout=120)
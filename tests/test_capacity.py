@@ -0,0 +1,45 @@
+from os import path
+
+import pandas as pd
+
+from conftest import FIXTURES, run_cli
+
+PLAN = path.join(FIXTURES, "plan.jmx")
+FAKE_JMETER = path.join(FIXTURES, "fakejmeter")
+
+
+def capacity(tmp_path, *argv, **env):
+    runs = tmp_path / "runs.txt"
+    runs.write_text("")
+    proc = run_cli("capacity", PLAN, "-o", tmp_path / "levels", *argv,
+                   env=dict(JMETER_PATH=FAKE_JMETER, FAKE_RUNS=str(runs),
+                            **env))
+    assert proc.returncode == 0, proc.stderr
+    return proc.stdout, len(runs.read_text().splitlines())
+
+
+def test_capacity_search(tmp_path):
+    stdout, runs = capacity(tmp_path, "--error-rate", "1", "--start", "10",
+                            "--max", "1000", "--resolution", "5",
+                            FAKE_CAPACITY="230")
+    # Samples start failing past 230 threads
+    assert "max CCU meeting the targets is" in stdout
+    assert 225 <= int(stdout.split()[-1]) <= 230
+    evidence = pd.read_csv(tmp_path / "levels" / "plan-capacity.csv")
+    assert runs == len(evidence)
+    # Doubling ramp, then bisection between 160 and 320
+    assert {10, 20, 40, 80, 160, 320} <= set(evidence["ccu"])
+    assert evidence["ccu"].max() == 320
+
+
+def test_capacity_reuses_levels(tmp_path):
+    argv = ["--p95", "40", "--start", "10", "--max", "100"]
+    # 10, 20, 40, 80 and 100
+    _, runs = capacity(tmp_path, *argv)
+    assert runs == 5
+    _, runs = capacity(tmp_path, *argv)
+    assert runs == 0
+
+    # Other options, the results of the levels cannot be reused
+    _, runs = capacity(tmp_path, *argv, "--duration", "10")
+    assert runs == 5
@@ -0,0 +1,75 @@
+import logging
+from argparse import Namespace
+from os import path
+from xml.etree import ElementTree as ET
+
+import pytest
+
+from jmx_tools import jmx_compile
+from jmx_tools import jmx_replace as jr
+from conftest import FIXTURES
+
+POSTMAN = path.join(FIXTURES, "postman.json")
+
+
+def test_compile_parses(tmp_path):
+    output = tmp_path / "plan.jmx"
+    args = Namespace(input=POSTMAN, output=str(output), bi=None, bf=None,
+                     ccu=5, duration=None, loops=None)
+    jmx_compile.main(args)
+
+    tree = ET.parse(output)
+    samplers = tree.findall(".//HTTPSamplerProxy")
+    assert [s.get("testname") for s in samplers] == \
+        ["items", "item", "new", "auth"]
+    threads = tree.find(".//stringProp[@name='ThreadGroup.num_threads']")
+    assert threads.text == "5"
+    assert list(tmp_path.iterdir()) == [output]
+
+
+def request(url, **fields):
+    return dict(name="r", request=dict(method="GET", url=url, **fields))
+
+
+def sampler_props(sampler):
+    return {prop.name: prop.text for prop in sampler.children
+            if hasattr(prop, "text")}
+
+
+@pytest.mark.parametrize("url", [
+    dict(host=["api", "example", "com"], path=["items", ":id"],
+         variable=[dict(key="id", value="5")]),
+    dict(host="api.example.com", path="/items/:id",
+         variable=[dict(key="id", value="5")]),
+    dict(host="api.example.com",
+         path=["items", dict(type="string", value=":id")],
+         variable=[dict(key="id", value="5")]),
+])
+def test_compile_request_url_forms(url):
+    sampler, _ = jmx_compile.compile_request(request(url))
+    props = sampler_props(sampler)
+    assert props["HTTPSampler.domain"] == "api.example.com"
+    assert props["HTTPSampler.path"] == "/items/5"
+
+
+def test_compile_request_auth(caplog):
+    bearer = dict(type="bearer", bearer=[dict(key="token", value="{{t}}")])
+    url = dict(host="h", path="a")
+    _, headers = jmx_compile.compile_request(request(url, auth=bearer))
+    assert headers == [("Authorization", "Bearer ${t}")]
+    # The token of the command line wins
+    _, headers = jmx_compile.compile_request(request(url, auth=bearer),
+                                             request_auth=False)
+    assert headers == []
+
+    with caplog.at_level(logging.WARNING):
+        _, headers = jmx_compile.compile_request(
+            request(url, auth=dict(type="basic")))
+    assert headers == []
+    assert "unsupported auth type basic" in caplog.text
+
+
+def test_true_endpoint_url_forms():
+    assert jr.true_endpoint(dict(path="/items/1")) == "/items/1"
+    assert jr.true_endpoint(dict(path=["items", "1"], query=[
+        dict(key="page", value="2")])) == "/items/1?page=2"
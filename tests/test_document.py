@@ -0,0 +1,70 @@
+from xml.etree import ElementTree as ET
+
+import pytest
+
+from jmx_tools.jmx_document import JmxDocument
+
+
+def sampler(name, path, method):
+    return (f'<HTTPSamplerProxy testclass="HTTPSamplerProxy" testname="{name}">'
+            f'<stringProp name="HTTPSampler.path">{path}</stringProp>'
+            f'<stringProp name="HTTPSampler.method">{method}</stringProp>'
+            '</HTTPSamplerProxy><hashTree/>')
+
+
+PLAN = f"""<jmeterTestPlan><hashTree>
+<TestPlan testclass="TestPlan" testname="plan"/><hashTree>
+<PostThreadGroup testclass="PostThreadGroup" testname="teardown"/><hashTree>
+{sampler("logout", "/auth", "delete")}
+</hashTree>
+<ThreadGroup testclass="ThreadGroup" testname="users"/><hashTree>
+{sampler("items", "/items", "GET")}
+{sampler("new", "/items", "POST")}
+{sampler("items again", "/items", "get")}
+{sampler("auth", "/auth", "GET")}
+{sampler("item", "/item", "GET")}
+</hashTree>
+<SetupThreadGroup testclass="SetupThreadGroup" testname="setup"/><hashTree>
+{sampler("login", "/auth", "POST")}
+</hashTree>
+<ThreadGroup testclass="ThreadGroup" testname="admins"/><hashTree>
+{sampler("admin items", "/items", "GET")}
+</hashTree>
+</hashTree></hashTree></jmeterTestPlan>"""
+
+
+@pytest.fixture
+def doc():
+    return JmxDocument(ET.ElementTree(ET.fromstring(PLAN)))
+
+
+def names(elements):
+    return [element.get("testname") for element in elements]
+
+
+def test_thread_groups_document_order(doc):
+    assert names(doc.thread_groups()) == \
+        ["teardown", "users", "setup", "admins"]
+
+
+@pytest.mark.parametrize("path, method, expected", [
+    # Fewer samplers by path than by method, and the other way around
+    ("/items", "get", ["items", "items again", "admin items"]),
+    ("/item", "GET", ["item"]),
+    ("/auth", "POST", ["login"]),
+    ("/items", "DELETE", []),
+    ("/none", "GET", []),
+    ("/items", None, ["items", "new", "items again", "admin items"]),
+    (None, "post", ["new", "login"]),
+])
+def test_samplers(doc, path, method, expected):
+    assert names(doc.samplers(path, method)) == expected
+
+
+def test_samplers_reindex(doc):
+    [item] = doc.samplers("/item", "GET")
+    doc.prop(item, "HTTPSampler.method").text = "PUT"
+    doc.reindex()
+    assert doc.samplers("/item", "GET") == []
+    assert doc.samplers("/item", "PUT") == [item]
+    assert len(doc.samplers()) == 8
@@ -0,0 +1,83 @@
+from os import listdir, path
+
+import pytest
+
+from jmx_tools import engines
+from conftest import FIXTURES, run_cli
+
+FAKE_SERVER = path.join(FIXTURES, "fakejmeter-server")
+
+
+def running_servers():
+    pids = []
+    for pid in filter(str.isdigit, listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as fp:
+                if FAKE_SERVER.encode() in fp.read():
+                    pids.append(pid)
+        except OSError:
+            continue
+    return pids
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    with engines.EnginePool(2, server_path=FAKE_SERVER) as pool:
+        yield pool
+    for engine in pool.engines:
+        assert engine.proc.poll() is not None
+
+
+def test_acquire_release(pool):
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+    assert first.proc.poll() is None and second.proc.poll() is None
+
+    pid = first.proc.pid
+    pool.release(first)
+    assert pool.acquire() is first
+    assert first.proc.pid == pid
+    pool.release(first)
+    pool.release(second)
+
+
+def test_unhealthy_engine_is_restarted(pool):
+    engine = pool.acquire()
+    pid = engine.proc.pid
+    old = engine.proc
+    pool.release(engine, healthy=False)
+    assert old.poll() is not None
+    assert engine.proc.pid != pid and engine.proc.poll() is None
+
+    # An engine that died during its test is restarted too
+    engine = pool.acquire()
+    engine.proc.kill()
+    engine.proc.wait()
+    pool.release(engine)
+    assert engine.proc.poll() is None
+
+
+def test_run_on_engines(tmp_path):
+    suite = tmp_path / "suite"
+    suite.mkdir()
+    plan = path.join(FIXTURES, "plan.jmx")
+    for name in ["a", "b", "c"]:
+        (suite / f"{name}.jmx").write_bytes(open(plan, "rb").read())
+    log = tmp_path / "engines.log"
+    proc = run_cli("run", "-i", "suite", "-o", "out", "--no-dashboard",
+                   "--engines", "2", cwd=tmp_path,
+                   env=dict(JMETER_PATH=path.join(FIXTURES, "fakejmeter"),
+                            JMETER_SERVER_PATH=FAKE_SERVER,
+                            FAKE_ENGINE_LOG=str(log),
+                            XDG_CACHE_HOME=str(tmp_path / "cache")))
+    assert proc.returncode == 0, proc.stderr
+
+    # Every test ran on one of the two engines
+    lines = [line.split() for line in log.read_text().splitlines()]
+    assert sorted(plan for _, plan in lines) == ["a.jmx", "b.jmx", "c.jmx"]
+    assert len({port for port, _ in lines}) <= 2
+    for name in ["a", "b", "c"]:
+        assert (tmp_path / "out" / "suite" / f"{name}.csv").exists()
+    assert running_servers() == []
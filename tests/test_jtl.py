@@ -0,0 +1,101 @@
+import json
+from argparse import Namespace
+from os import path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from jmx_tools import jtl
+from conftest import FIXTURES
+
+# statistics.json was written by Jmeter 5.5's report generator:
+#   jmeter -g results.jtl -o report
+JTL = path.join(FIXTURES, "results.jtl")
+STATISTICS = path.join(FIXTURES, "statistics.json")
+
+
+# Tolerances documented by `aggregate_jtl`
+EXACT = {"transaction", "sampleCount", "errorCount", "minResTime",
+         "maxResTime"}
+# Jmeter computes errorPct in single precision
+FLOAT = {"errorPct": 1e-6}
+ROUNDING = 1e-9
+
+
+@pytest.mark.parametrize("chunksize", [500_000, 7])
+def test_aggregate_matches_jmeter(chunksize):
+    with open(STATISTICS) as fp:
+        expected = json.load(fp)
+    results = jtl.aggregate_jtl(JTL, chunksize)
+    assert results.keys() == expected.keys()
+    for label, stats in expected.items():
+        assert results[label].keys() == stats.keys()
+        for key, value in stats.items():
+            if key in EXACT:
+                assert results[label][key] == value, (label, key)
+            else:
+                rel = FLOAT.get(key, ROUNDING)
+                assert results[label][key] == pytest.approx(value, rel=rel), \
+                    (label, key)
+
+
+def test_histograms_round_trip(tmp_path):
+    stats = jtl.collect_jtl(JTL)
+    file = tmp_path / "results.hist.json"
+    jtl.save_histograms(stats, file)
+    loaded = jtl.load_histograms(file)
+    assert loaded.keys() == stats.keys()
+    for label, s in stats.items():
+        for key in ["count", "errors", "elapsed_sum", "elapsed_min",
+                    "elapsed_max"]:
+            assert getattr(loaded[label], key) == getattr(s, key)
+        assert loaded[label].histogram.buckets == s.histogram.buckets
+        assert loaded[label].histogram.count == s.histogram.count
+
+
+def merge(tmp_path, *inputs):
+    output = tmp_path / "merged.csv"
+    hist = tmp_path / "merged.hist.json"
+    jtl.main_merge(Namespace(inputs=inputs, output=str(output),
+                             histogram=str(hist)))
+    return pd.read_csv(output).set_index("transaction"), hist
+
+
+def test_merge_matches_samples(tmp_path):
+    with open(STATISTICS) as fp:
+        expected = json.load(fp)
+    file = tmp_path / "results.hist.json"
+    jtl.save_histograms(jtl.collect_jtl(JTL), file)
+    df, _ = merge(tmp_path, file)
+    assert set(df.index) == expected.keys()
+
+    samples = pd.read_csv(JTL)
+    for label, row in df.iterrows():
+        stats = expected[label]
+        for key in ["sampleCount", "errorCount", "minResTime", "maxResTime"]:
+            assert row[key] == stats[key], (label, key)
+        assert row["meanResTime"] == pytest.approx(stats["meanResTime"])
+        # Nearest rank percentiles, within the relative error of the buckets
+        elapsed = samples["elapsed"] if label == "Total" else \
+            samples.loc[samples["label"] == label, "elapsed"]
+        for key, p in [("medianResTime", 50), ("pct1ResTime", 90),
+                       ("pct2ResTime", 95), ("pct3ResTime", 99)]:
+            exact = np.percentile(elapsed, p, method="inverted_cdf")
+            assert row[key] == pytest.approx(exact, rel=0.01), (label, key)
+
+
+def test_merge_adds_runs(tmp_path):
+    file = tmp_path / "results.hist.json"
+    jtl.save_histograms(jtl.collect_jtl(JTL), file)
+    single, _ = merge(tmp_path, file)
+    double, hist = merge(tmp_path, file, file)
+    assert (double["sampleCount"] == single["sampleCount"] * 2).all()
+    assert (double["errorCount"] == single["errorCount"] * 2).all()
+    for key in ["meanResTime", "minResTime", "maxResTime", "medianResTime",
+                "pct1ResTime", "pct2ResTime", "pct3ResTime"]:
+        assert np.allclose(double[key], single[key]), key
+
+    # The merged histogram can be merged again
+    again, _ = merge(tmp_path, hist, file)
+    assert (again["sampleCount"] == single["sampleCount"] * 3).all()
@@ -0,0 +1,33 @@
+import logging
+from argparse import ArgumentParser
+from os import path
+
+from jmx_tools import jmx_replace as jr
+from conftest import FIXTURES
+
+PLAN = path.join(FIXTURES, "plan.jmx")
+
+
+def replace(*argv):
+    parser = ArgumentParser()
+    jr.add_args(parser)
+    jr.main(parser.parse_args(list(argv)))
+
+
+def test_manifest_skips_unchanged_output(tmp_path, caplog):
+    output = tmp_path / "out.jmx"
+    replace(PLAN, "-o", str(output), "--ccu", "5", "-j", "1")
+    with caplog.at_level(logging.INFO):
+        replace(PLAN, "-o", str(output), "--ccu", "5", "-j", "1")
+    assert "up to date" in caplog.text
+
+
+def test_manifest_rewrites_modified_output(tmp_path, caplog):
+    output = tmp_path / "out.jmx"
+    replace(PLAN, "-o", str(output), "--ccu", "5", "-j", "1")
+    expected = output.read_bytes()
+    output.write_bytes(b"edited")
+    with caplog.at_level(logging.INFO):
+        replace(PLAN, "-o", str(output), "--ccu", "5", "-j", "1")
+    assert "up to date" not in caplog.text
+    assert output.read_bytes() == expected
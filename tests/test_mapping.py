@@ -0,0 +1,12 @@
+from io import StringIO
+from xml.etree import ElementTree as ET
+
+from jmx_tools import jmx_mapping as jm
+
+
+def test_write_xml_matches_tostring():
+    sampler = jm.http_sampler("localhost", 8080, '/items?q="a&b"<c>',
+                              method="get")
+    fp = StringIO()
+    jm.write_xml(sampler, fp)
+    assert fp.getvalue() == ET.tostring(jm.to_xml(sampler), encoding="unicode")
@@ -0,0 +1,56 @@
+import json
+import shutil
+from argparse import ArgumentParser
+from os import path
+from xml.etree.ElementTree import ParseError
+
+import pytest
+
+from jmx_tools import jmx_replace as jr
+from jmx_tools import utils
+from conftest import FIXTURES
+
+PLAN = path.join(FIXTURES, "plan.jmx")
+
+
+def replace(*argv):
+    parser = ArgumentParser()
+    jr.add_args(parser)
+    jr.main(parser.parse_args([str(arg) for arg in argv]))
+
+
+@pytest.fixture
+def inputs(tmp_path, monkeypatch):
+    # Outputs of a directory keep the path of the inputs
+    monkeypatch.chdir(tmp_path)
+    d = tmp_path / "inputs"
+    d.mkdir()
+    shutil.copy(PLAN, d / "a.jmx")
+    (d / "b.jmx").write_text("<jmeterTestPlan>")
+    return d
+
+
+def test_single_file_raises_original_error(tmp_path, inputs):
+    with pytest.raises(ParseError):
+        replace(inputs / "b.jmx", "-o", tmp_path / "b.jmx", "--ccu", "5")
+
+
+def test_serial_stops_at_first_error(tmp_path, inputs):
+    # The last of three files fails, in the order they are found
+    shutil.copy(PLAN, inputs / "b.jmx")
+    shutil.copy(PLAN, inputs / "c.jmx")
+    files = [file for file, _ in utils.mux_input_output("inputs", "out")]
+    with open(files[-1], "w") as fp:
+        fp.write("<jmeterTestPlan>")
+    with pytest.raises(ParseError):
+        replace("inputs", "-o", "out", "--ccu", "5", "-j", "1")
+    with open(tmp_path / "out" / jr.MANIFEST_FILE) as fp:
+        assert sorted(json.load(fp)["files"]) == sorted(files[:-1])
+
+
+def test_pool_reports_every_error(tmp_path, inputs, caplog):
+    shutil.copy(inputs / "b.jmx", inputs / "c.jmx")
+    with pytest.raises(RuntimeError, match="2 of 3 files failed"):
+        replace("inputs", "-o", "out", "--ccu", "5", "-j", "2")
+    assert "Failed to process" in caplog.text
+    assert (tmp_path / "out" / "inputs" / "a.jmx").exists()
@@ -0,0 +1,78 @@
+from os import listdir, path
+
+from jmx_tools import jmx_replace as jr
+from conftest import FIXTURES
+
+POSTMAN = path.join(FIXTURES, "postman.json")
+
+
+def test_postman_index_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(jr, "_postman_indexes", {})
+    index = jr.load_postman_index(POSTMAN)
+    cache = tmp_path / "jmx-tools" / "postman"
+    assert [f for f in listdir(cache) if f.endswith(".pickle")] == \
+        listdir(cache)
+
+    # Loaded back from the cache by a new process
+    monkeypatch.setattr(jr, "_postman_indexes", {})
+    monkeypatch.setattr(jr.PostmanIndex, "build", None)
+    assert jr.load_postman_index(POSTMAN).hash == index.hash
+
+
+def test_postman_index_unwritable_cache(tmp_path, monkeypatch):
+    # The cache directory cannot be created under a file
+    (tmp_path / "file").write_text("")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "file"))
+    monkeypatch.setattr(jr, "_postman_indexes", {})
+    index = jr.load_postman_index(POSTMAN)
+    assert len(index.requests) == 4
+
+
+ENDPOINTS = [
+    "/api/v1/items",
+    "/api/v1/items?page=1",
+    "/api/v1/items/new",
+    "/api/v2/items/new",
+    "/api/v1/auth/login",
+    "/api/v1/auth/login/refresh",
+]
+
+
+def match(text):
+    m = jr.PostmanMatcher(ENDPOINTS).match(text)
+    return m.kind, m.candidates
+
+
+def test_matcher_exact():
+    assert match("/api/v1/items") == ("exact", ["/api/v1/items"])
+    assert match("/api/v1/items?page=1") == ("exact", ["/api/v1/items?page=1"])
+    assert match("api/v1/auth/login") == ("exact", ["/api/v1/auth/login"])
+
+
+def test_matcher_prefix():
+    # A different query is not an exact match, the closest path wins
+    assert match("/api/v1/items?page=2") == \
+        ("prefix", ["/api/v1/items", "/api/v1/items?page=1"])
+    assert jr.PostmanMatcher(["/items?page=1"]).match("/items").kind == \
+        "prefix"
+    assert match("/api/v1/auth") == ("prefix", ["/api/v1/auth/login"])
+    # Found by the trie even though the raw text is not in the endpoint
+    assert match("/api/v1/auth/") == ("prefix", ["/api/v1/auth/login"])
+
+
+def test_matcher_substring():
+    assert match("/items/new") == \
+        ("substring", ["/api/v1/items/new", "/api/v2/items/new"])
+    assert match("/login") == ("substring", ["/api/v1/auth/login"])
+    assert match("tems/ne") == \
+        ("substring", ["/api/v1/items/new", "/api/v2/items/new"])
+    assert jr.PostmanMatcher(ENDPOINTS).match("/orders") is None
+
+
+def test_matcher_ambiguous():
+    matcher = jr.PostmanMatcher(ENDPOINTS)
+    m = matcher.match("/items/new")
+    assert m.ambiguous and m.endpoint == "/api/v1/items/new"
+    assert not matcher.match("/api/v2/items").ambiguous
+    assert list(matcher.ambiguous) == ["/items/new"]
@@ -0,0 +1,52 @@
+import pytest
+
+from jmx_tools import report
+
+
+def test_parse_ccu_file_name():
+    assert report.parse_ccu("tests/test-200.jmx.csv") == 200
+    assert report.parse_ccu("run-3/test-200.csv") == 200
+
+
+def test_parse_ccu_path():
+    # The CCU is in a directory, the file names are all the same
+    assert report.parse_ccu("outputs-200/run/test.csv") == 200
+    assert report.parse_ccu("outputs-200/run-3/test.csv",
+                            r"outputs-(\d+)/") == 200
+    assert report.parse_ccu("tests/200/test-1.csv", r"/(\d+)/") == 200
+
+
+def test_parse_ccu_missing():
+    with pytest.raises(RuntimeError):
+        report.parse_ccu("outputs/test.csv")
+    with pytest.raises(RuntimeError):
+        report.parse_ccu("outputs-200/test.csv", r"ccu(\d+)")
+
+
+def test_find_knee():
+    ccus = [100, 200, 300, 400]
+    # Linear up to 300 users, flat and slower after
+    throughputs = [50, 100, 150, 152]
+    latencies = [100, 100, 110, 300]
+    assert report.find_knee(ccus, throughputs, latencies) == 300
+
+
+def test_find_knee_needs_latency_growth():
+    ccus = [100, 200, 300, 400]
+    # Throughput stops scaling but the p95 stays flat
+    throughputs = [50, 100, 150, 152]
+    latencies = [100, 100, 110, 115]
+    assert report.find_knee(ccus, throughputs, latencies) is None
+    assert report.find_knee(ccus, throughputs, latencies,
+                            max_latency_growth=0.01) == 300
+
+
+def test_find_knee_scaling():
+    ccus = [100, 200, 400]
+    assert report.find_knee(ccus, [50, 100, 200], [100, 120, 200]) is None
+    # A drop of throughput is a negative efficiency
+    assert report.find_knee(ccus, [50, 40, 30], [100, 200, 400]) == 100
+    # Levels that cannot be compared are skipped
+    assert report.find_knee([0, 100, 100, 200], [0, 50, 50, 20],
+                            [0, 100, 100, 500]) == 100
+    assert report.find_knee([], [], []) is None
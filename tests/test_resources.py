@@ -0,0 +1,47 @@
+from subprocess import TimeoutExpired
+
+from jmx_tools import resources
+from jmx_tools.resources import ResourceMonitor
+
+
+def monitor(samples):
+    m = ResourceMonitor(pid=0, interval=1, output_file=None)
+    m.samples = samples
+    return m
+
+
+def samples(old_used_mb, gc_time_s=0.01, heap_used_mb=1000):
+    # One sample per second, one young collection per sample
+    return [dict(time=t, cpu_pct=20, heap_used_mb=heap_used_mb,
+                 old_used_mb=old_used_mb, gc_count=t, gc_time_s=t * gc_time_s)
+            for t in range(20)]
+
+
+def test_full_eden_is_not_saturated():
+    # -Xms = -Xmx: used heap close to the max, small live set
+    result = monitor(samples(old_used_mb=200)).saturation(heap_gb=1)
+    assert result["generatorHeapPct"] < 25
+    assert result["generatorGcPct"] < 2
+    assert not result["generatorSaturated"]
+
+
+def test_old_generation_saturated():
+    result = monitor(samples(old_used_mb=980)).saturation(heap_gb=1)
+    assert result["generatorHeapPct"] > 90
+    assert result["generatorSaturated"]
+
+
+def test_gc_time_saturated():
+    result = monitor(samples(old_used_mb=200, gc_time_s=0.3)).saturation(
+        heap_gb=1)
+    assert result["generatorGcPct"] == 30
+    assert result["generatorSaturated"]
+
+
+def test_jstat_timeout_skips_the_sample(monkeypatch):
+    def timeout(cmd, **kwargs):
+        raise TimeoutExpired(cmd, kwargs["timeout"])
+
+    monkeypatch.setattr(resources.shutil, "which", lambda name: name)
+    monkeypatch.setattr(resources, "run", timeout)
+    assert resources.jstat_gc(1) is None
@@ -0,0 +1,148 @@
+import shutil
+import signal
+import subprocess
+import time
+from argparse import Namespace
+from os import environ, kill, path
+
+import pytest
+
+from conftest import FIXTURES, cli_command, run_cli
+
+PLAN = path.join(FIXTURES, "plan.jmx")
+FAKE_JMETER = path.join(FIXTURES, "fakejmeter")
+
+
+def alive(pid):
+    try:
+        kill(pid, 0)
+        with open(f"/proc/{pid}/stat") as fp:
+            return fp.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (ProcessLookupError, FileNotFoundError):
+        return False
+
+
+def wait_for(predicate, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_abort_requires_live(tmp_path):
+    proc = run_cli("run", "-i", PLAN, "-o", tmp_path / "plan.csv",
+                   "--abort-p95", "1000")
+    assert proc.returncode == 2
+    assert "--abort-p95 requires --live" in proc.stderr
+
+
+@pytest.mark.parametrize("signum", [signal.SIGINT, signal.SIGTERM],
+                         ids=["SIGINT", "SIGTERM"])
+def test_interrupt_stops_jmeter(tmp_path, signum):
+    # With an abort threshold, Jmeter runs in its own session and does not
+    # get the Ctrl-C of the terminal
+    shutil.copy(PLAN, tmp_path)
+    jvm_file = tmp_path / "jvm.pid"
+    jvm = None
+    proc = subprocess.Popen(
+        cli_command("run", "-i", tmp_path / "plan.jmx",
+                    "-o", tmp_path / "plan.csv", "--no-dashboard",
+                    "--live", "1", "--abort-p95", "100000"),
+        env={**environ, "JMETER_PATH": FAKE_JMETER,
+             "FAKE_JVM": str(jvm_file)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(lambda: jvm_file.exists() and jvm_file.read_text())
+        jvm = int(jvm_file.read_text())
+        assert alive(jvm)
+        proc.send_signal(signum)
+        proc.wait(timeout=30)
+        wait_for(lambda: not alive(jvm), timeout=10)
+    finally:
+        proc.kill()
+        if jvm is not None and alive(jvm):
+            kill(jvm, signal.SIGKILL)
+
+
+def test_scheduled_plans_leave_out_running_heaps(monkeypatch):
+    from jmx_tools import jmx_run
+    from jmx_tools.jvm import JvmPlan
+
+    # 5000MB available, a test needs a 2048MB heap and 1000MB more
+    available = []
+    running = []
+
+    def plan_jvm(jmx_file, available_mb):
+        available.append(available_mb)
+        if available_mb < 3048:
+            raise RuntimeError("does not fit")
+        return JvmPlan(2048, 256, 256)
+
+    def run_test(args, jmx_file, output_file, prefix=None, engine=None,
+                 plan=None):
+        running.append(jmx_file)
+        time.sleep(0.2)
+        running.remove(jmx_file)
+        return len(running)
+
+    monkeypatch.setattr(jmx_run, "available_memory_mb", lambda: 5000)
+    monkeypatch.setattr(jmx_run, "plan_jvm", plan_jvm)
+    monkeypatch.setattr(jmx_run, "run_test", run_test)
+    args = Namespace(parallel=3, heap="auto", heap_budget=None,
+                     cpu_budget=None, cpus_per_test=1)
+    tests = [(f"test-{i}.jmx", f"test-{i}.csv") for i in range(3)]
+    # The tests ran alone, each waited for the memory of the previous one
+    assert jmx_run.run_scheduled(args, tests) == [0, 0, 0]
+    assert available == [5000, 5000 - 2048, 5000, 5000 - 2048, 5000]
+
+
+def test_scheduled_plan_fails_alone(monkeypatch):
+    from jmx_tools import jmx_run
+
+    def plan_jvm(jmx_file, available_mb):
+        raise RuntimeError("does not fit")
+
+    monkeypatch.setattr(jmx_run, "available_memory_mb", lambda: 1000)
+    monkeypatch.setattr(jmx_run, "plan_jvm", plan_jvm)
+    args = Namespace(parallel=2, heap="auto", heap_budget=None,
+                     cpu_budget=None, cpus_per_test=1)
+    assert jmx_run.run_scheduled(args, [("a.jmx", "a.csv")]) == [-1]
+
+
+def run_args(**options):
+    defaults = dict(heap=None, force=False, no_dashboard=False, live=None,
+                    abort_error_rate=None, abort_p95=None, abort_p99=None,
+                    abort_min_samples=100, monitor=None, store=None,
+                    histogram=False)
+    return Namespace(**{**defaults, **options})
+
+
+@pytest.fixture
+def fake_jmeter(monkeypatch):
+    from jmx_tools import jmx_run
+
+    get_jmeter_cmd = jmx_run.get_jmeter_cmd
+    monkeypatch.setattr(
+        jmx_run, "get_jmeter_cmd",
+        lambda *a, **kw: [FAKE_JMETER, *get_jmeter_cmd(*a, **kw)[1:]])
+    return jmx_run
+
+
+def test_dashboard_run_does_not_read_the_log(tmp_path, fake_jmeter,
+                                             monkeypatch):
+    shutil.copy(PLAN, tmp_path)
+    monkeypatch.setattr(fake_jmeter, "collect_jtl", None)
+    output = tmp_path / "plan.csv"
+    assert fake_jmeter.run_test(run_args(), str(tmp_path / "plan.jmx"),
+                                str(output)) == 0
+    assert "Login" in output.read_text()
+    assert not (tmp_path / "plan.hist.json").exists()
+
+
+@pytest.mark.parametrize("no_dashboard", [False, True])
+def test_histogram_on_request(tmp_path, fake_jmeter, no_dashboard):
+    shutil.copy(PLAN, tmp_path)
+    args = run_args(no_dashboard=no_dashboard, histogram=True)
+    assert fake_jmeter.run_test(args, str(tmp_path / "plan.jmx"),
+                                str(tmp_path / "plan.csv")) == 0
+    assert (tmp_path / "plan.hist.json").exists()
@@ -0,0 +1,84 @@
+import json
+from os import listdir, path
+
+import numpy as np
+import pytest
+
+from jmx_tools.store import Store
+from conftest import FIXTURES
+
+JTL = path.join(FIXTURES, "results.jtl")
+STATISTICS = path.join(FIXTURES, "statistics.json")
+
+# Column of the query -> key of Jmeter's statistics.json
+KEYS = {"sampleCount": "sampleCount", "errorCount": "errorCount",
+        "errorPct": "errorPct", "meanResTime": "meanResTime",
+        "minResTime": "minResTime", "maxResTime": "maxResTime",
+        "p50": "medianResTime", "p90": "pct1ResTime",
+        "p95": "pct2ResTime", "p99": "pct3ResTime"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = Store(str(tmp_path / "store"))
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("chunksize", [500_000, 7])
+def test_ingest_query_matches_jmeter(store, chunksize):
+    with open(STATISTICS) as fp:
+        expected = json.load(fp)
+    run_id = store.ingest(JTL, test="results", chunksize=chunksize, ccu=50)
+    df = store.query(test="results")
+    assert sorted(df["label"]) == sorted(set(expected) - {"Total"})
+    for _, row in df.iterrows():
+        assert row["run_id"] == run_id and row["ccu"] == 50
+        stats = expected[row["label"]]
+        for column, key in KEYS.items():
+            assert row[column] == pytest.approx(stats[key], rel=1e-6), \
+                (row["label"], column)
+
+    run = store.runs(test="results").iloc[0]
+    assert run["samples"] == expected["Total"]["sampleCount"]
+    # Only the columns are left in the run folder
+    assert sorted(listdir(store.run_dir(run_id))) == [
+        "bytes.npy", "elapsed.npy", "sentBytes.npy", "success.npy",
+        "timeStamp.npy"]
+    assert listdir(path.join(store.directory, "runs")) == [str(run_id)]
+
+
+def test_ingest_sorts_by_label_and_elapsed(store):
+    chunked = store.ingest(JTL, chunksize=7)
+    whole = store.ingest(JTL)
+    for name in ["elapsed", "timeStamp", "success", "bytes", "sentBytes"]:
+        assert np.array_equal(store.column(chunked, name),
+                              store.column(whole, name)), name
+
+    elapsed = store.column(chunked, "elapsed")
+    labels = store.db.execute(
+        "SELECT offset, count FROM labels WHERE run_id = ? ORDER BY offset",
+        (chunked,)).fetchall()
+    assert sum(count for _, count in labels) == len(elapsed)
+    for offset, count in labels:
+        rows = elapsed[offset:offset + count]
+        assert np.all(rows[:-1] <= rows[1:])
+
+
+def test_query_filters(store):
+    first = store.ingest(JTL, test="a", ccu=10)
+    second = store.ingest(JTL, test="a", ccu=20)
+    store.ingest(JTL, test="b", ccu=10)
+    assert set(store.query(test="a")["run_id"]) == {first, second}
+    assert set(store.query(ccu=10, label="Login")["test"]) == {"a", "b"}
+    assert set(store.query(test="a", last=1)["run_id"]) == {second}
+    assert store.query(label="Unknown").empty
+
+
+def test_ingest_no_samples(store, tmp_path):
+    jtl = tmp_path / "empty.jtl"
+    jtl.write_text("timeStamp,elapsed,label,responseCode,success,"
+                   "bytes,sentBytes\n")
+    with pytest.raises(RuntimeError):
+        store.ingest(str(jtl))
+    assert listdir(path.join(store.directory, "runs")) == []
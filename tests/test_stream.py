@@ -0,0 +1,39 @@
+from os import path, listdir
+
+import pytest
+
+from jmx_tools import jmx_replace as jr
+from conftest import FIXTURES
+
+PLAN = path.join(FIXTURES, "plan.jmx")
+
+
+def callbacks():
+    return [
+        [],
+        [jr.ReplaceBearer("n&w"), jr.ReplaceCCU(5), jr.NameToPath(True),
+         jr.ReplaceDomain("a&b")],
+    ]
+
+
+@pytest.mark.parametrize("cbs", callbacks())
+def test_stream_matches_walk(tmp_path, cbs):
+    expected = tmp_path / "walk.jmx"
+    output = tmp_path / "stream.jmx"
+    jr.walk_etree(PLAN, cbs).write(expected, encoding="utf-8")
+    jr.stream_etree(PLAN, str(output), cbs)
+    assert output.read_bytes() == expected.read_bytes()
+
+
+def test_stream_failure_leaves_no_tmp(tmp_path):
+    class Broken(jr.Callback):
+        def condition(self, element):
+            return element.tag == "HTTPSamplerProxy"
+
+        def callback(self, element):
+            raise ValueError("broken")
+
+    output = tmp_path / "out.jmx"
+    with pytest.raises(ValueError):
+        jr.stream_etree(PLAN, str(output), [Broken()])
+    assert listdir(tmp_path) == []
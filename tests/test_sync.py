@@ -0,0 +1,133 @@
+import os
+import socket
+import threading
+import time
+from argparse import Namespace
+
+import pytest
+import requests
+import uvicorn
+
+from jmx_tools import sync
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def push(tmp_path, monkeypatch):
+    """Start a push server on an ephemeral port, publishing files of src/."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    src = tmp_path / "src"
+    src.mkdir()
+    servers = []
+
+    def start(files):
+        port = free_port()
+        config = uvicorn.Config(sync.make_app(files, src), host="127.0.0.1",
+                                port=port, log_level="warning")
+        server = uvicorn.Server(config)
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        servers.append((server, thread))
+        return port
+
+    yield src, start
+    for server, thread in servers:
+        server.should_exit = True
+        thread.join()
+
+
+def pull(dst, port, monkeypatch):
+    monkeypatch.chdir(dst)
+    sync.main_pull(Namespace(host="127.0.0.1", port=port, jobs=2))
+
+
+def test_pull_large_file(tmp_path, push, monkeypatch, capsys):
+    src, start = push
+    (src / "sub").mkdir()
+    (src / "sub" / "a.jmx").write_text("<jmeterTestPlan/>")
+    # Larger than a chunk, partly compressible
+    data = os.urandom(3 * sync.CHUNK_SIZE) + b"0,1,/items,true\n" * 200_000
+    (src / "big.jtl").write_bytes(data)
+    port = start(["sub/a.jmx", "big.jtl"])
+
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    pull(dst, port, monkeypatch)
+    assert (dst / "big.jtl").read_bytes() == data
+    assert (dst / "sub" / "a.jmx").read_text() == "<jmeterTestPlan/>"
+    assert "[OK] big.jtl" in capsys.readouterr().out
+
+
+def test_pull_only_changed_files(tmp_path, push, monkeypatch, capsys):
+    src, start = push
+    (src / "a.jmx").write_text("a")
+    (src / "b.jmx").write_text("b")
+    port = start(["a.jmx", "b.jmx"])
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    pull(dst, port, monkeypatch)
+    capsys.readouterr()
+
+    pull(dst, port, monkeypatch)
+    assert "2 files up to date, 0 pulled" in capsys.readouterr().out
+
+    # Edited after the push started, with the same and another size
+    (src / "a.jmx").write_text("A")
+    (src / "b.jmx").write_text("bigger")
+    pull(dst, port, monkeypatch)
+    assert "0 files up to date, 2 pulled" in capsys.readouterr().out
+    assert (dst / "a.jmx").read_text() == "A"
+    assert (dst / "b.jmx").read_text() == "bigger"
+
+
+def test_range_request(push):
+    src, start = push
+    data = os.urandom(100_000)
+    (src / "big.jtl").write_bytes(data)
+    port = start(["big.jtl"])
+
+    url = f"http://127.0.0.1:{port}{sync.endpoint}/files/big.jtl"
+    res = requests.get(url, headers={"Range": "bytes=1000-"})
+    assert res.status_code == 206
+    assert res.headers["Content-Range"] == "bytes 1000-99999/100000"
+    assert res.content == data[1000:]
+    res = requests.get(url, headers={"Range": "bytes=100000-"})
+    assert res.status_code == 416
+
+
+def test_pull_resumes_part(tmp_path, push, monkeypatch, capsys):
+    src, start = push
+    data = os.urandom(2 * sync.CHUNK_SIZE)
+    (src / "big.jtl").write_bytes(data)
+    port = start(["big.jtl"])
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    (dst / "big.jtl.part").write_bytes(data[:12345])
+
+    pull(dst, port, monkeypatch)
+    assert "[OK] big.jtl (resumed at 12345 bytes)" in capsys.readouterr().out
+    assert (dst / "big.jtl").read_bytes() == data
+    assert not (dst / "big.jtl.part").exists()
+
+
+def test_pull_restarts_stale_part(tmp_path, push, monkeypatch, capsys):
+    src, start = push
+    data = os.urandom(2 * sync.CHUNK_SIZE)
+    (src / "big.jtl").write_bytes(data)
+    port = start(["big.jtl"])
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    # Left by a pull of an older version of the file
+    (dst / "big.jtl.part").write_bytes(os.urandom(12345))
+
+    pull(dst, port, monkeypatch)
+    assert "[OK] big.jtl\n" in capsys.readouterr().out
+    assert (dst / "big.jtl").read_bytes() == data
+    assert not (dst / "big.jtl.part").exists()
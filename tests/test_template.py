@@ -0,0 +1,59 @@
+import logging
+from argparse import ArgumentParser
+from os import path
+
+import pytest
+
+from jmx_tools import jmx_replace as jr
+from jmx_tools import jmx_template as jt
+from conftest import FIXTURES
+
+PLAN = path.join(FIXTURES, "plan.jmx")
+
+
+@pytest.mark.parametrize("cbs", [
+    [],
+    [jr.ReplaceBearer("n&w"), jr.ReplaceCCU(5), jr.ReplaceDuration("1m"),
+     jr.ReplaceLoopCount(-1), jr.ReplaceDomain(""),
+     jr.ReplaceProtocol("https")],
+])
+def test_template_matches_walk(tmp_path, cbs):
+    expected = tmp_path / "walk.jmx"
+    output = tmp_path / "template.jmx"
+    jr.walk_etree(PLAN, cbs).write(expected, encoding="utf-8")
+    jt.JmxTemplate(PLAN).write(str(output), cbs)
+    assert output.read_bytes() == expected.read_bytes()
+
+
+def batch(tmp_path, *argv):
+    parser = ArgumentParser()
+    jr.add_args(parser)
+    return [parser.parse_args([PLAN, "-o", str(tmp_path / f"out-{ccu}.jmx"),
+                               "--ccu", str(ccu), *argv])
+            for ccu in (5, 10)]
+
+
+def test_batch_uses_manifest(tmp_path, caplog):
+    jt.main(batch(tmp_path))
+    for ccu in (5, 10):
+        expected = jr.walk_etree(PLAN, [jr.ReplaceCCU(ccu)])
+        expected.write(tmp_path / "expected.jmx", encoding="utf-8")
+        assert (tmp_path / f"out-{ccu}.jmx").read_bytes() == \
+            (tmp_path / "expected.jmx").read_bytes()
+    assert (tmp_path / jr.MANIFEST_FILE).exists()
+
+    # Up to date, unless modified since
+    (tmp_path / "out-10.jmx").write_bytes(b"edited")
+    with caplog.at_level(logging.INFO):
+        jt.main(batch(tmp_path))
+    assert f"{tmp_path / 'out-5.jmx'} is up to date" in caplog.text
+    assert f"{tmp_path / 'out-10.jmx'} is up to date" not in caplog.text
+    assert (tmp_path / "out-10.jmx").read_bytes() == \
+        (tmp_path / "expected.jmx").read_bytes()
+
+
+def test_batch_jobs_uses_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(jt.JmxTemplate, "write", None)
+    jt.main(batch(tmp_path, "--jobs", "2"))
+    assert (tmp_path / "out-5.jmx").exists()
+    assert (tmp_path / "out-10.jmx").exists()